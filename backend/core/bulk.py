@@ -0,0 +1,445 @@
+"""
+用户和租户的批量导入 / 导出
+
+导入：请求体为 NDJSON（每行一个 JSON 对象）或 CSV（首行为列名，每行一条记录，引号内可含换行），边接收边按批处理：
+- 每批先逐行校验，再用一次 IN 查询检查数据库中的唯一性冲突，批内及跨批重复在内存中检查
+- 用户密码在进程池中并行哈希
+- 一批只执行一次 executemany 插入并提交；插入冲突（并发写入）时该批逐行重试，定位出错的行
+每行的错误按行号返回，不影响其他行
+
+导出：服务端游标分批读取，以 NDJSON 或 CSV 流式返回
+"""
+import asyncio
+import csv
+import io
+import json
+import multiprocessing
+import os
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+
+from shared.config import get_settings
+from shared.database import ReadSessionLocal, SessionLocal
+from shared.models import Tenant, User
+from shared.models.user import UserRole
+from shared.schemas.auth import UserCreate
+from shared.utils.auth import hash_passwords
+
+settings = get_settings()
+
+
+class TenantImport(BaseModel):
+    """批量导入的租户行"""
+    name: str = Field(..., min_length=1, max_length=100)
+    display_name: Optional[str] = Field(None, max_length=200)
+
+
+# ==================== 解析 ====================
+
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    按行切分请求体，返回 (行号, 内容)，包括空行
+    超过 BULK_IMPORT_MAX_LINE_BYTES 的行不再缓冲，内容返回 None，其余部分丢弃到下一个换行符
+    """
+    limit = settings.BULK_IMPORT_MAX_LINE_BYTES
+    buffer = b""
+    number = 0
+    skipping = False
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            if skipping:
+                skipping = False
+            else:
+                yield number, line if len(line) <= limit else None
+        if len(buffer) > limit:
+            if not skipping:
+                skipping = True
+                yield number + 1, None
+            buffer = b""
+    if buffer and not skipping:
+        yield number + 1, buffer
+
+
+async def iter_records(stream: AsyncIterator[bytes], content_type: str) -> AsyncIterator[Tuple[int, object]]:
+    """
+    解析 NDJSON 或 CSV 记录，无法解析的行以字符串形式返回错误信息
+    CSV 的引号内可以包含换行，此时一条记录跨多行，行号为记录的第一行；
+    单行及单条记录均不超过 BULK_IMPORT_MAX_LINE_BYTES
+    """
+    limit = settings.BULK_IMPORT_MAX_LINE_BYTES
+    too_long = f"Record exceeds {limit} bytes"
+    is_csv = "csv" in content_type
+    header: Optional[List[str]] = None
+    pending = ""
+    pending_size = 0
+    start = 0
+    async for number, line in iter_lines(stream):
+        if line is None:
+            yield (start if pending else number), too_long
+            pending, pending_size = "", 0
+            continue
+        try:
+            text = line.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            yield (start if pending else number), "Invalid UTF-8"
+            pending, pending_size = "", 0
+            continue
+
+        if not is_csv:
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError as e:
+                yield number, f"Invalid JSON: {e}"
+                continue
+            yield number, record if isinstance(record, dict) else "Expected a JSON object"
+            continue
+
+        if not pending:
+            if not text.strip():
+                continue
+            start = number
+        pending += text + "\n"
+        pending_size += len(line) + 1
+        # 引号未成对时记录尚未结束（字段内的引号转义为 ""，不影响奇偶）
+        if pending.count('"') % 2:
+            if pending_size > limit:
+                yield start, too_long
+                pending, pending_size = "", 0
+            continue
+        try:
+            values = next(csv.reader([pending]))
+        except csv.Error as e:
+            yield start, f"Invalid CSV: {e}"
+            continue
+        finally:
+            pending, pending_size = "", 0
+
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield start, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        # CSV 中的空值视为未提供
+        yield start, {k: v for k, v in zip(header, values) if v != ""}
+
+    if pending:
+        yield start, "Unterminated quoted field"
+
+
+def _error_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in item['loc'])}: {item['msg']}" for item in error.errors()
+    )
+
+
+# ==================== 密码哈希进程池 ====================
+
+_hash_pool: Optional[ProcessPoolExecutor] = None
+_hash_workers = 1
+
+
+def hash_pool() -> ProcessPoolExecutor:
+    """
+    批量导入使用的进程池，首次使用时创建
+    使用 spawn 启动子进程，避免在已运行事件循环和线程的 worker 中 fork
+    """
+    global _hash_pool, _hash_workers
+    if _hash_pool is None:
+        _hash_workers = settings.BULK_HASH_PROCESSES or os.cpu_count() or 1
+        _hash_pool = ProcessPoolExecutor(
+            max_workers=_hash_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _hash_pool
+
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False, cancel_futures=True)
+        _hash_pool = None
+
+
+async def _hash_all(passwords: List[str]) -> List[str]:
+    pool = hash_pool()
+    loop = asyncio.get_running_loop()
+    # 按进程数均分，每个进程处理一段
+    size = max(1, -(-len(passwords) // _hash_workers))
+    chunks = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+    results = await asyncio.gather(*[loop.run_in_executor(pool, hash_passwords, chunk) for chunk in chunks])
+    return [hashed for chunk in results for hashed in chunk]
+
+
+# ==================== 导入 ====================
+
+
+class ImportResult:
+    """导入结果，错误按行号记录"""
+
+    def __init__(self):
+        self.created = 0
+        self.errors: List[Dict[str, object]] = []
+
+    def fail(self, line: int, error: str):
+        self.errors.append({"line": line, "error": error})
+
+    def to_dict(self) -> dict:
+        # 校验错误在读取时记录，唯一性冲突在批次写入时记录，按行号排序后返回
+        errors = sorted(self.errors, key=lambda error: error["line"])
+        return {"created": self.created, "failed": len(errors), "errors": errors}
+
+
+class _Importer(ABC):
+    """按批导入，子类定义校验、唯一字段和待插入的值"""
+
+    table = None
+    unique_fields: Tuple[str, ...] = ()
+
+    def __init__(self):
+        self.result = ImportResult()
+        # 本次导入中已出现的唯一值，用于批内和跨批去重
+        self.seen: Dict[str, Set[str]] = {field: set() for field in self.unique_fields}
+
+    @abstractmethod
+    def validate(self, record: dict):
+        """返回校验后的行对象，失败时抛出 ValueError 或 ValidationError"""
+
+    def existing_conflicts(self, db, rows: List[Tuple[int, object]]) -> Dict[str, Set[str]]:
+        """一次查询返回数据库中已存在的唯一值"""
+        columns = [getattr(self.table.c, field) for field in self.unique_fields]
+        conditions = [
+            column.in_({getattr(row, field) for _, row in rows})
+            for column, field in zip(columns, self.unique_fields)
+        ]
+        existing: Dict[str, Set[str]] = {field: set() for field in self.unique_fields}
+        for found in db.execute(select(*columns).where(or_(*conditions))):
+            for field, value in zip(self.unique_fields, found):
+                existing[field].add(value)
+        return existing
+
+    @abstractmethod
+    async def values(self, rows: List[Tuple[int, object]]) -> List[dict]:
+        """待插入的列值"""
+
+    def _check_batch(self, db, rows: List[Tuple[int, object]]) -> List[Tuple[int, object]]:
+        existing = self.existing_conflicts(db, rows)
+        accepted = []
+        for line, row in rows:
+            conflict = next(
+                (f for f in self.unique_fields if getattr(row, f) in existing[f] or getattr(row, f) in self.seen[f]),
+                None,
+            )
+            if conflict is not None:
+                self.result.fail(line, f"{conflict} already exists")
+                continue
+            for field in self.unique_fields:
+                self.seen[field].add(getattr(row, field))
+            accepted.append((line, row))
+        return accepted
+
+    def _insert(self, lines: List[int], values: List[dict]):
+        with SessionLocal() as db:
+            try:
+                db.execute(insert(self.table), values)
+                db.commit()
+                self.result.created += len(values)
+                return
+            except IntegrityError:
+                db.rollback()
+
+            # 与并发写入冲突：逐行插入，定位冲突的行
+            for line, row in zip(lines, values):
+                try:
+                    db.execute(insert(self.table), [row])
+                    db.commit()
+                    self.result.created += 1
+                except IntegrityError as e:
+                    db.rollback()
+                    self.result.fail(line, f"Integrity error: {e.orig}")
+
+    async def _flush(self, batch: List[Tuple[int, object]]):
+        def check():
+            with SessionLocal() as db:
+                return self._check_batch(db, batch)
+
+        accepted = await asyncio.to_thread(check)
+        if not accepted:
+            return
+        values = await self.values(accepted)
+        await asyncio.to_thread(self._insert, [line for line, _ in accepted], values)
+
+    async def run(self, records: AsyncIterator[Tuple[int, object]]) -> ImportResult:
+        batch: List[Tuple[int, object]] = []
+        async for line, record in records:
+            if isinstance(record, str):
+                self.result.fail(line, record)
+                continue
+            try:
+                batch.append((line, self.validate(record)))
+            except ValidationError as e:
+                self.result.fail(line, _error_message(e))
+                continue
+            except ValueError as e:
+                self.result.fail(line, str(e))
+                continue
+            if len(batch) >= settings.BULK_IMPORT_BATCH_SIZE:
+                await self._flush(batch)
+                batch = []
+        if batch:
+            await self._flush(batch)
+        return self.result
+
+
+class UserImporter(_Importer):
+    """批量导入用户：username, email, password，可选 tenant_id, role"""
+
+    table = User.__table__
+    unique_fields = ("username", "email")
+
+    def __init__(
+        self,
+        default_tenant_id: Optional[str] = None,
+        forced_tenant_id: Optional[str] = None,
+        allowed_roles: Optional[Set[UserRole]] = None,
+    ):
+        """
+        default_tenant_id: 行内未指定租户时使用的租户
+        forced_tenant_id: 所有行强制使用的租户（租户管理员导入时）
+        allowed_roles: 允许创建的角色，None 为不限制
+        """
+        super().__init__()
+        self.default_tenant_id = default_tenant_id
+        self.forced_tenant_id = forced_tenant_id
+        self.allowed_roles = allowed_roles
+        self._known_tenants: Set[str] = set()
+
+    def validate(self, record: dict):
+        if self.forced_tenant_id is not None:
+            record = {**record, "tenant_id": self.forced_tenant_id}
+        elif self.default_tenant_id is not None and not record.get("tenant_id"):
+            record = {**record, "tenant_id": self.default_tenant_id}
+        row = UserCreate.model_validate(record)
+        try:
+            role = UserRole(row.role)
+        except ValueError:
+            raise ValueError(f"Unknown role: {row.role}")
+        if self.allowed_roles is not None and role not in self.allowed_roles:
+            raise ValueError(f"Role not allowed: {row.role}")
+        return row
+
+    def _check_batch(self, db, rows):
+        # 引用的租户必须存在（同样一次查询）
+        tenant_ids = {row.tenant_id for _, row in rows if row.tenant_id} - self._known_tenants
+        if tenant_ids:
+            self._known_tenants |= set(db.scalars(select(Tenant.id).where(Tenant.id.in_(tenant_ids))))
+        valid = []
+        for line, row in rows:
+            if row.tenant_id and row.tenant_id not in self._known_tenants:
+                self.result.fail(line, f"Tenant not found: {row.tenant_id}")
+            else:
+                valid.append((line, row))
+        return super()._check_batch(db, valid) if valid else []
+
+    async def values(self, rows):
+        hashed = await _hash_all([row.password for _, row in rows])
+        now = datetime.utcnow()
+        return [
+            {
+                "id": str(uuid.uuid4()),
+                "tenant_id": row.tenant_id,
+                "username": row.username,
+                "email": row.email,
+                "hashed_password": password_hash,
+                "role": UserRole(row.role),
+                "is_active": True,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for (_, row), password_hash in zip(rows, hashed)
+        ]
+
+
+class TenantImporter(_Importer):
+    """批量导入租户：name，可选 display_name（默认与 name 相同）"""
+
+    table = Tenant.__table__
+    unique_fields = ("name",)
+
+    def validate(self, record: dict):
+        return TenantImport.model_validate(record)
+
+    async def values(self, rows):
+        now = datetime.utcnow()
+        return [
+            {
+                "id": str(uuid.uuid4()),
+                "name": row.name,
+                "display_name": row.display_name or row.name,
+                "is_active": True,
+                "config": {},
+                "enabled_services": [],
+                "created_at": now,
+                "updated_at": now,
+            }
+            for _, row in rows
+        ]
+
+
+# ==================== 导出 ====================
+
+USER_EXPORT_COLUMNS = (
+    User.id, User.tenant_id, User.username, User.email, User.role, User.is_active, User.created_at, User.last_login,
+)
+TENANT_EXPORT_COLUMNS = (Tenant.id, Tenant.name, Tenant.display_name, Tenant.is_active, Tenant.created_at)
+
+
+def _plain(value):
+    if isinstance(value, UserRole):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def export_rows(columns, fmt: str, where=None) -> Iterator[bytes]:
+    """
+    流式导出，使用服务端游标（yield_per，PostgreSQL 上为命名游标）每次只取一批行
+    生成器在线程池中迭代，会话在生成器内创建，导出期间一直有效
+    """
+    names = [column.key for column in columns]
+    statement = select(*columns).order_by(columns[0])
+    if where is not None:
+        statement = statement.where(where)
+
+    with ReadSessionLocal() as db:
+        result = db.execute(statement.execution_options(yield_per=settings.BULK_EXPORT_BATCH_SIZE))
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(names)
+            for partition in result.partitions():
+                writer.writerows([_plain(v) for v in row] for row in partition)
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue().encode()
+        else:
+            for partition in result.partitions():
+                yield "".join(
+                    json.dumps(dict(zip(names, map(_plain, row))), ensure_ascii=False) + "\n" for row in partition
+                ).encode()
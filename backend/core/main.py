@@ -2,11 +2,13 @@
 核心服务 - Core Service
 提供租户管理、用户管理、认证等核心功能
 """
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Body, Depends, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
+from typing import Any, Dict, List, Optional
 import sys
 import os
 
@@ -14,14 +16,29 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from shared.config import get_settings
-from shared.database import get_db, Base, engine
+from shared.tracing import instrument_tracing
+from shared.query_stats import instrument_query_stats
+from shared.metrics import instrument_app
+from shared.database import get_db, get_read_db, add_read_your_writes, check_schema_version, violated_column
 from shared.models import User, Tenant
-from shared.schemas.auth import UserCreate, UserResponse, LoginRequest, Token
-from shared.utils.auth import verify_password, get_password_hash, create_access_token, create_refresh_token
+from shared.models.user import UserRole
+from shared.schemas.auth import UserCreate, UserResponse, LoginRequest, RefreshRequest, Token
+from shared.utils.auth import (
+    verify_and_update_password_async, get_password_hash_async,
+    create_access_token, create_refresh_token, decode_token, load_auth_backends,
+)
+from shared.utils.revocation import revocation_store
+from shared import activity
+from core import bulk
+from core.tenant_config import VersionConflict, tenant_configs, update_config
+from shared.tenant_config import TENANT_CONFIG_VERSION_HEADER, TENANT_ID_HEADER, TenantConfig, parse_etag
 from shared.dependencies import get_current_user
 
 settings = get_settings()
 
+# 核心服务负责登录和签发令牌，密码哈希与 JWT 依赖在导入时（fork 前）加载
+load_auth_backends()
+
 # 创建 FastAPI 应用
 app = FastAPI(
     title="Core Service",
@@ -38,11 +55,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求指标与 /metrics 端点
+instrument_app(app)
+
+# 分布式追踪
+instrument_tracing(app, "core")
+
+# 请求级数据库耗时（Server-Timing）与慢查询日志
+instrument_query_stats(app)
+
+# 只读副本的写后读一致性
+add_read_your_writes(app)
+
 
 @app.on_event("startup")
 async def startup_event():
-    """启动时创建数据库表"""
-    Base.metadata.create_all(bind=engine)
+    """启动时校验数据库结构版本（建表由迁移命令完成）"""
+    check_schema_version()
+    await revocation_store.start()
+    activity.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await revocation_store.stop()
+    await activity.stop()
+    bulk.shutdown_hash_pool()
 
 
 @app.get("/")
@@ -58,28 +96,23 @@ async def root():
 # ==================== 认证相关 ====================
 
 
+_REGISTER_CONFLICTS = {
+    "username": "Username already registered",
+    "email": "Email already registered",
+    "tenant_id": "Tenant not found",
+}
+
+
 @app.post("/auth/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def register(
     user_data: UserCreate,
     db: Session = Depends(get_db),
 ):
-    """用户注册"""
-    # 检查用户名是否已存在
-    if db.query(User).filter(User.username == user_data.username).first():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered",
-        )
-
-    # 检查邮箱是否已存在
-    if db.query(User).filter(User.email == user_data.email).first():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered",
-        )
-
-    # 创建用户
-    hashed_password = get_password_hash(user_data.password)
+    """
+    用户注册
+    直接插入，由唯一约束判断用户名、邮箱是否已存在：只有一次插入往返，并发注册同名用户时也只有一个成功
+    """
+    hashed_password = await get_password_hash_async(user_data.password)
     user = User(
         username=user_data.username,
         email=user_data.email,
@@ -89,10 +122,22 @@ async def register(
     )
 
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    try:
+        db.flush()
+    except IntegrityError as e:
+        db.rollback()
+        detail = _REGISTER_CONFLICTS.get(violated_column(e, "users"))
+        if detail is None:
+            raise
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=detail,
+        )
 
-    return user
+    # 插入后所有列都已在本地（均为客户端默认值），提交前生成响应，避免提交后重新查询
+    response = UserResponse.model_validate(user)
+    db.commit()
+    return response
 
 
 @app.post("/auth/login", response_model=Token)
@@ -104,7 +149,11 @@ async def login(
     # 查找用户
     user = db.query(User).filter(User.username == login_data.username).first()
 
-    if not user or not verify_password(login_data.password, user.hashed_password):
+    verified, new_hash = (False, None)
+    if user:
+        verified, new_hash = await verify_and_update_password_async(login_data.password, user.hashed_password)
+
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -117,9 +166,13 @@ async def login(
             detail="User account is disabled",
         )
 
-    # 更新最后登录时间
-    user.last_login = datetime.utcnow()
-    db.commit()
+    # 哈希算法或参数已变更时随登录透明地重新哈希
+    if new_hash:
+        user.hashed_password = new_hash
+        db.commit()
+
+    # 最后登录时间由后台批量写回，登录不等待写事务
+    activity.last_login.touch(user.id)
 
     # 生成令牌
     token_data = {
@@ -138,6 +191,81 @@ async def login(
     }
 
 
+def _decode_refresh_token(token: str) -> dict:
+    payload = decode_token(token)
+    if payload is None or payload.get("type") != "refresh" or not payload.get("jti") or not payload.get("fam"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return payload
+
+
+def _family_expiry(payload: dict) -> int:
+    # 令牌族中的刷新令牌最晚在此时过期（早于 fam_exp 引入的令牌以自身过期时间为准）
+    return int(payload.get("fam_exp") or payload["exp"])
+
+
+@app.post("/auth/refresh", response_model=Token)
+async def refresh(data: RefreshRequest, db: Session = Depends(get_db)):
+    """
+    使用刷新令牌换取新的令牌对
+    刷新令牌只能使用一次（轮换）；已使用过的刷新令牌再次出现说明可能已泄露，整个令牌族随之吊销
+    令牌族的有效期从登录时算起，轮换不会延长；用户的状态、角色和租户按主键查询一次，不计算密码哈希
+    """
+    payload = _decode_refresh_token(data.refresh_token)
+    family = payload["fam"]
+
+    if revocation_store.is_revoked(family):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    if not await revocation_store.revoke(payload["jti"], payload["exp"]):
+        await revocation_store.revoke(family, _family_expiry(payload))
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token has already been used",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    # 已停用或删除的用户不能继续刷新，角色和租户以数据库为准
+    user = db.get(User, payload.get("sub"))
+    if user is None or not user.is_active:
+        await revocation_store.revoke(family, _family_expiry(payload))
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found or disabled",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    token_data = {
+        "sub": user.id,
+        "tenant_id": user.tenant_id,
+        "role": user.role,
+    }
+    return {
+        "access_token": create_access_token(token_data),
+        "refresh_token": create_refresh_token(
+            token_data,
+            family=family,
+            family_expires=_family_expiry(payload),
+        ),
+        "token_type": "bearer",
+    }
+
+
+@app.post("/auth/logout")
+async def logout(data: RefreshRequest):
+    """注销：吊销刷新令牌所在的令牌族，访问令牌在短有效期后自然失效"""
+    payload = _decode_refresh_token(data.refresh_token)
+    await revocation_store.revoke(payload["fam"], _family_expiry(payload))
+    return {"message": "Logged out"}
+
+
 @app.get("/auth/me", response_model=UserResponse)
 async def get_me(current_user: User = Depends(get_current_user)):
     """获取当前用户信息"""
@@ -149,7 +277,7 @@ async def get_me(current_user: User = Depends(get_current_user)):
 
 @app.get("/users", response_model=List[UserResponse])
 async def list_users(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """获取用户列表"""
@@ -157,10 +285,85 @@ async def list_users(
     return users
 
 
+def _require_admin(user: User):
+    if user.role not in (UserRole.SUPER_ADMIN, UserRole.TENANT_ADMIN):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Insufficient permissions",
+        )
+
+
+def _require_super_admin(user: User):
+    if user.role != UserRole.SUPER_ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Insufficient permissions",
+        )
+
+
+def _admin_tenant(user: User) -> Optional[str]:
+    """超级管理员不限租户（返回 None），租户管理员限定为自己的租户"""
+    _require_admin(user)
+    if user.role == UserRole.SUPER_ADMIN:
+        return None
+    if user.tenant_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Tenant admin is not assigned to a tenant",
+        )
+    return user.tenant_id
+
+
+def _export_response(rows, fmt: str, name: str) -> StreamingResponse:
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    extension = "csv" if fmt == "csv" else "ndjson"
+    return StreamingResponse(
+        rows,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'},
+    )
+
+
+@app.post("/users/import")
+async def import_users(
+    request: Request,
+    tenant_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    批量导入用户，请求体为 NDJSON 或 CSV（Content-Type: text/csv）
+    字段：username, email, password，可选 tenant_id, role；tenant_id 参数为未指定租户的行提供默认值
+    租户管理员只能导入到自己的租户，且不能创建超级管理员
+    """
+    own_tenant = _admin_tenant(current_user)
+    if own_tenant is None:
+        importer = bulk.UserImporter(default_tenant_id=tenant_id)
+    else:
+        importer = bulk.UserImporter(
+            forced_tenant_id=own_tenant,
+            allowed_roles={UserRole.TENANT_ADMIN, UserRole.USER},
+        )
+    records = bulk.iter_records(request.stream(), request.headers.get("content-type", ""))
+    result = await importer.run(records)
+    return result.to_dict()
+
+
+@app.get("/users/export")
+async def export_users(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    tenant_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+):
+    """流式导出用户（不含密码哈希），租户管理员只能导出自己租户的用户"""
+    tenant_id = _admin_tenant(current_user) or tenant_id
+    where = User.tenant_id == tenant_id if tenant_id is not None else None
+    return _export_response(bulk.export_rows(bulk.USER_EXPORT_COLUMNS, format, where), format, "users")
+
+
 @app.get("/users/{user_id}", response_model=UserResponse)
 async def get_user(
     user_id: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """获取用户详情"""
@@ -185,25 +388,50 @@ async def create_tenant(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """创建租户"""
-    # 检查租户名是否已存在
-    if db.query(Tenant).filter(Tenant.name == name).first():
+    """创建租户，租户名是否重复由唯一约束判断"""
+    tenant = Tenant(name=name, display_name=display_name)
+    db.add(tenant)
+    try:
+        db.flush()
+    except IntegrityError as e:
+        db.rollback()
+        if violated_column(e, "tenants") != "name":
+            raise
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Tenant name already exists",
         )
 
-    tenant = Tenant(name=name, display_name=display_name)
-    db.add(tenant)
+    response = jsonable_encoder(tenant)
     db.commit()
-    db.refresh(tenant)
+    return response
 
-    return tenant
+
+@app.post("/tenants/import")
+async def import_tenants(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+):
+    """批量导入租户，请求体为 NDJSON 或 CSV，字段：name，可选 display_name"""
+    _require_super_admin(current_user)
+    records = bulk.iter_records(request.stream(), request.headers.get("content-type", ""))
+    result = await bulk.TenantImporter().run(records)
+    return result.to_dict()
+
+
+@app.get("/tenants/export")
+async def export_tenants(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user: User = Depends(get_current_user),
+):
+    """流式导出租户"""
+    _require_super_admin(current_user)
+    return _export_response(bulk.export_rows(bulk.TENANT_EXPORT_COLUMNS, format), format, "tenants")
 
 
 @app.get("/tenants")
 async def list_tenants(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """获取租户列表"""
@@ -214,7 +442,7 @@ async def list_tenants(
 @app.get("/tenants/{tenant_id}")
 async def get_tenant(
     tenant_id: str,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """获取租户详情"""
@@ -229,6 +457,80 @@ async def get_tenant(
     return tenant
 
 
+def _config_headers(entry: TenantConfig) -> Dict[str, str]:
+    # 网关据此更新自己的缓存
+    return {
+        "ETag": entry.etag,
+        TENANT_ID_HEADER: entry.tenant_id,
+        TENANT_CONFIG_VERSION_HEADER: str(entry.version),
+    }
+
+
+def _config_response(entry: TenantConfig, response: Response) -> dict:
+    response.headers.update(_config_headers(entry))
+    return entry.to_dict()
+
+
+@app.get("/tenants/{tenant_id}/config")
+async def get_tenant_config(
+    tenant_id: str,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    获取租户配置（本地缓存，最多落后 TENANT_CONFIG_TTL_SECONDS 秒）
+    支持 If-None-Match 条件请求，版本未变时返回 304
+    """
+    if current_user.role != UserRole.SUPER_ADMIN and current_user.tenant_id != tenant_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Insufficient permissions",
+        )
+
+    entry = await tenant_configs.get(tenant_id)
+    if entry is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Tenant not found",
+        )
+
+    if parse_etag(request.headers.get("if-none-match")) == entry.version:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_config_headers(entry))
+    return _config_response(entry, response)
+
+
+@app.put("/tenants/{tenant_id}/config")
+async def put_tenant_config(
+    tenant_id: str,
+    request: Request,
+    response: Response,
+    config: Dict[str, Any] = Body(...),
+    current_user: User = Depends(get_current_user),
+):
+    """替换租户配置，版本号加一；携带 If-Match 时仅在版本一致时修改，否则返回 412"""
+    admin_tenant = _admin_tenant(current_user)
+    if admin_tenant is not None and admin_tenant != tenant_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Insufficient permissions",
+        )
+
+    try:
+        entry = await update_config(tenant_id, config, parse_etag(request.headers.get("if-match")))
+    except VersionConflict:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Tenant config has been modified",
+        )
+    if entry is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Tenant not found",
+        )
+    return _config_response(entry, response)
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -10,10 +10,12 @@ backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, backend_dir)
 
 if __name__ == "__main__":
-    import uvicorn
+    from shared.server import run_service
+    from shared.utils.revocation import check_workers
 
     print("启动核心服务...")
     print("地址: http://localhost:8002")
     print("API 文档: http://localhost:8002/docs")
 
-    uvicorn.run("main:app", host="0.0.0.0", port=8002, reload=True)
+    # 默认多进程生产模式，开发时使用 python run.py --reload
+    run_service("core.main:app", port=8002, preflight=check_workers)
@@ -0,0 +1,80 @@
+"""
+租户配置服务
+读取走进程内缓存（shared.tenant_config），过期后先只查询版本号，版本变化时才加载配置；
+写入时版本号在数据库中原子加一，并立即更新本 worker 的缓存
+"""
+import asyncio
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select, update
+
+from shared.config import get_settings
+from shared.database import SessionLocal
+from shared.models import Tenant
+from shared.tenant_config import TenantConfig, TenantConfigCache
+
+settings = get_settings()
+
+
+class VersionConflict(Exception):
+    """If-Match 中的版本号与当前版本不一致"""
+
+
+def _fetch_sync(tenant_id: str, cached: Optional[TenantConfig]) -> Optional[TenantConfig]:
+    with SessionLocal() as db:
+        if cached is not None:
+            version = db.scalar(select(Tenant.config_version).where(Tenant.id == tenant_id))
+            if version is None:
+                return None
+            if version == cached.version:
+                return cached
+        row = db.execute(
+            select(Tenant.config_version, Tenant.config).where(Tenant.id == tenant_id)
+        ).first()
+    if row is None:
+        return None
+    return TenantConfig(tenant_id, row.config_version, row.config or {})
+
+
+async def _fetch(tenant_id: str, cached: Optional[TenantConfig]) -> Optional[TenantConfig]:
+    return await asyncio.to_thread(_fetch_sync, tenant_id, cached)
+
+
+tenant_configs = TenantConfigCache(
+    _fetch,
+    ttl=settings.TENANT_CONFIG_TTL_SECONDS,
+    maxsize=settings.TENANT_CONFIG_CACHE_SIZE,
+)
+
+
+def _update_sync(tenant_id: str, config: Dict[str, Any], expected_version: Optional[int]) -> Optional[TenantConfig]:
+    statement = (
+        update(Tenant.__table__)
+        .where(Tenant.id == tenant_id)
+        .values(config=config, config_version=Tenant.config_version + 1)
+        .returning(Tenant.config_version)
+    )
+    if expected_version is not None:
+        statement = statement.where(Tenant.config_version == expected_version)
+    with SessionLocal() as db:
+        version = db.scalar(statement)
+        if version is None:
+            exists = db.scalar(select(Tenant.id).where(Tenant.id == tenant_id))
+            db.rollback()
+            if exists is None:
+                return None
+            raise VersionConflict()
+        db.commit()
+    return TenantConfig(tenant_id, version, config)
+
+
+async def update_config(
+    tenant_id: str,
+    config: Dict[str, Any],
+    expected_version: Optional[int] = None,
+) -> Optional[TenantConfig]:
+    """替换租户配置，返回新版本；租户不存在时返回 None，版本不一致时抛出 VersionConflict"""
+    entry = await asyncio.to_thread(_update_sync, tenant_id, config, expected_version)
+    if entry is not None:
+        tenant_configs.put(entry)
+    return entry
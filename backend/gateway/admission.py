@@ -0,0 +1,248 @@
+"""
+准入控制 - 按上游和租户的自适应并发上限（AIMD）
+过载时快速拒绝请求，而不是在网关内无限排队
+
+过载信号只有两类：请求失败（5xx、超时、连接失败）和排队。排队按路由判断：
+每个路由分别维护长期延迟基线和近期延迟，近期延迟持续超过基线的容忍倍数时视为上游在排队，
+因此同一服务中快慢不同的接口不会互相误判
+"""
+import re
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from shared.config import get_settings
+from shared.utils.auth import decode_token
+
+settings = get_settings()
+
+ANONYMOUS_TENANT = "anonymous"
+
+# 路由键只取路径前几段，含数字的段（ID）合并为 *
+_ROUTE_DEPTH = 3
+_ID_SEGMENT = re.compile(r"\d")
+
+
+def route_of(method: str, path: str) -> str:
+    segments = [s for s in path.split("/") if s][:_ROUTE_DEPTH]
+    return " ".join([method] + ["*" if _ID_SEGMENT.search(s) else s for s in segments])
+
+
+class RouteLatency:
+    """单个路由的延迟：长期基线（慢速 EWMA）与近期延迟（快速 EWMA）"""
+
+    WARMUP_SAMPLES = 10
+
+    def __init__(self):
+        self.baseline = 0.0
+        self.recent = 0.0
+        self.samples = 0
+
+    def queueing(self, latency: float) -> bool:
+        """记录样本，返回近期延迟是否持续超过基线的容忍倍数"""
+        self.samples += 1
+        if self.samples == 1:
+            self.baseline = self.recent = latency
+            return False
+        tolerance = settings.GATEWAY_ADMISSION_LATENCY_TOLERANCE
+        # 单个样本的影响有上限，偶发的慢请求不会单独触发
+        latency = min(latency, self.baseline * tolerance * 2)
+        self.recent += (latency - self.recent) * 0.2
+        self.baseline += (latency - self.baseline) * 0.02
+        return self.samples > self.WARMUP_SAMPLES and self.recent > self.baseline * tolerance
+
+
+class AdaptiveLimit:
+    """
+    AIMD 并发上限
+    过载时乘性减小，否则在高利用率下加性增大
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self._last_decrease = 0.0
+
+    def has_capacity(self, reserve: float = 0.0) -> bool:
+        """reserve 为预留给优先通道的容量比例（至少预留一个并发）"""
+        limit = self.limit
+        if reserve > 0:
+            limit = max(limit - max(1.0, limit * reserve), 1.0)
+        return self.in_flight < limit
+
+    def on_sample(self, started_at: float, overloaded: bool):
+        if overloaded:
+            # 每个窗口只减小一次：减小之前发出的请求不再重复计入
+            if started_at >= self._last_decrease:
+                self.limit = max(self.min_limit, self.limit * settings.GATEWAY_ADMISSION_BACKOFF_RATIO)
+                self._last_decrease = time.monotonic()
+        elif self.in_flight >= self.limit / 2:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+class AdmissionTicket:
+    """一次已准入的请求"""
+
+    def __init__(self, limits: List[AdaptiveLimit], route: RouteLatency, started_at: float):
+        self._limits = limits
+        self._route = route
+        self.started_at = started_at
+        self._sampled = False
+        self._released = False
+
+    def start(self):
+        """请求体读取完毕、开始发往上游时重新计时"""
+        self.started_at = time.monotonic()
+
+    def observe(self, status_code: int):
+        """上游返回响应头时记录延迟样本"""
+        if self._sampled:
+            return
+        self._sampled = True
+        failed = status_code >= 500 and status_code != status.HTTP_501_NOT_IMPLEMENTED
+        if failed:
+            overloaded = True
+        else:
+            overloaded = self._route.queueing(time.monotonic() - self.started_at)
+        for limit in self._limits:
+            limit.on_sample(self.started_at, overloaded)
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        # 未收到响应（超时、连接失败）视为失败
+        if not self._sampled:
+            self._sampled = True
+            for limit in self._limits:
+                limit.on_sample(self.started_at, True)
+        for limit in self._limits:
+            limit.in_flight -= 1
+
+
+class _Bounded(OrderedDict):
+    """按最近使用淘汰的字典，超出容量时只淘汰空闲的条目"""
+
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def touch(self, key, factory):
+        value = self.get(key)
+        if value is None:
+            value = self[key] = factory()
+            if len(self) > self.maxsize:
+                for old in list(islice(self, len(self) - self.maxsize)):
+                    if getattr(self[old], "in_flight", 0) == 0:
+                        del self[old]
+        else:
+            self.move_to_end(key)
+        return value
+
+
+class AdmissionController:
+    """网关准入控制器"""
+
+    def __init__(self):
+        size = settings.GATEWAY_ADMISSION_MAX_KEYS
+        self.upstreams = _Bounded(size)
+        self.tenants = _Bounded(size)
+        self.routes = _Bounded(size)
+        self.priority_paths = {
+            p.strip().strip("/") for p in settings.GATEWAY_ADMISSION_PRIORITY_PATHS.split(",") if p.strip()
+        }
+        # 初始上限默认取上游并发额度，冷启动时不因上限过小而拒绝正常的突发流量
+        self.initial_limit = settings.GATEWAY_ADMISSION_INITIAL_LIMIT or settings.GATEWAY_UPSTREAM_MAX_STREAMS
+
+    def _upstream(self, service_name: str) -> AdaptiveLimit:
+        return self.upstreams.touch(service_name, lambda: AdaptiveLimit(
+            min(self.initial_limit, settings.GATEWAY_ADMISSION_MAX_LIMIT),
+            settings.GATEWAY_ADMISSION_MIN_LIMIT,
+            settings.GATEWAY_ADMISSION_MAX_LIMIT,
+        ))
+
+    def _tenant(self, tenant_key: str) -> AdaptiveLimit:
+        return self.tenants.touch(tenant_key, lambda: AdaptiveLimit(
+            min(self.initial_limit, settings.GATEWAY_ADMISSION_TENANT_MAX_LIMIT),
+            settings.GATEWAY_ADMISSION_MIN_LIMIT,
+            settings.GATEWAY_ADMISSION_TENANT_MAX_LIMIT,
+        ))
+
+    def is_priority(self, path: str) -> bool:
+        """健康检查、认证等优先通道"""
+        return path.strip("/").split("/", 1)[0] in self.priority_paths
+
+    def admit(self, service_name: str, route: str, tenant_key: str, priority: bool) -> AdmissionTicket:
+        """
+        准入检查，超出上限时抛出 HTTPException
+        上游过载返回 503，租户超限返回 429，均带 Retry-After
+        """
+        upstream = self._upstream(service_name)
+        limits = [upstream]
+        retry_after = {"Retry-After": str(settings.GATEWAY_ADMISSION_RETRY_AFTER)}
+
+        if priority:
+            # 优先通道可以使用为其预留的容量，且不受租户上限约束
+            if not upstream.has_capacity():
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail=f"Service '{service_name}' is overloaded",
+                    headers=retry_after,
+                )
+        else:
+            reserve = settings.GATEWAY_ADMISSION_PRIORITY_RESERVE
+            if not upstream.has_capacity(reserve):
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail=f"Service '{service_name}' is overloaded",
+                    headers=retry_after,
+                )
+            tenant = self._tenant(tenant_key)
+            if not tenant.has_capacity():
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many concurrent requests for tenant",
+                    headers=retry_after,
+                )
+            limits.append(tenant)
+
+        for limit in limits:
+            limit.in_flight += 1
+        latency = self.routes.touch((service_name, route), RouteLatency)
+        return AdmissionTicket(limits, latency, time.monotonic())
+
+
+@lru_cache(maxsize=4096)
+def _tenant_of_token(token: str) -> Tuple[str, float]:
+    """(租户, 过期时间)；只接受访问令牌，刷新令牌和无效令牌视为匿名"""
+    payload = decode_token(token)
+    if not payload or payload.get("type") != "access":
+        return ANONYMOUS_TENANT, float("inf")
+    return payload.get("tenant_id") or ANONYMOUS_TENANT, float(payload.get("exp", 0))
+
+
+def admission_key(request: Request, tenant: str) -> str:
+    """租户限流的键；匿名请求按客户端地址分别限流，互不影响"""
+    if tenant != ANONYMOUS_TENANT:
+        return tenant
+    client = request.client.host if request.client else ""
+    return f"{ANONYMOUS_TENANT}:{client}"
+
+
+def tenant_of_request(request: Request) -> str:
+    """从 Bearer 令牌中取租户，用于按租户限流和读取租户配置"""
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return ANONYMOUS_TENANT
+    # 缓存的结果在令牌过期后不再使用
+    tenant, expires_at = _tenant_of_token(token)
+    if time.time() >= expires_at:
+        return ANONYMOUS_TENANT
+    return tenant
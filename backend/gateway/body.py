@@ -0,0 +1,151 @@
+"""
+请求体 / 响应体大小限制与落盘缓冲
+请求体边接收边计数，超过上限立即返回 413，不再读取剩余部分；需要缓冲的请求体（h2c 回退时重发）
+超过 GATEWAY_BODY_SPOOL_BYTES 后写入临时文件，每个请求占用的内存以该阈值为上限
+
+上限可由服务元数据 max_request_body_bytes / max_response_body_bytes 覆盖，0 表示不限制
+"""
+import asyncio
+import tempfile
+from typing import AsyncIterator, Optional, Tuple, Union
+
+from fastapi import HTTPException, Request, status
+
+from shared.config import get_settings
+from shared.metrics import counter
+
+settings = get_settings()
+
+CHUNK_SIZE = 64 * 1024
+
+body_rejected = counter(
+    "gateway_body_rejected_total",
+    "Request or response bodies rejected for exceeding the size limit",
+    ("direction",),
+)
+_request_rejected = body_rejected.labels("request")
+_response_rejected = body_rejected.labels("response")
+
+
+class BodyTooLarge(Exception):
+    """上游响应体超过上限"""
+
+
+def body_limits(service: dict) -> Tuple[int, int]:
+    """(请求体上限, 响应体上限)，服务元数据优先于全局配置"""
+    metadata = service.get("service_metadata") or {}
+    return (
+        int(metadata.get("max_request_body_bytes", settings.GATEWAY_MAX_REQUEST_BODY_BYTES)),
+        int(metadata.get("max_response_body_bytes", settings.GATEWAY_MAX_RESPONSE_BODY_BYTES)),
+    )
+
+
+def exceeds(size: int, limit: int) -> bool:
+    return limit > 0 and size > limit
+
+
+def declared_length(headers) -> Optional[int]:
+    """Content-Length 的值，缺失或格式错误时返回 None"""
+    value = headers.get("content-length")
+    if value and value.isdigit():
+        return int(value)
+    return None
+
+
+def _request_too_large(limit: int) -> HTTPException:
+    _request_rejected.inc()
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Request body exceeds {limit} bytes",
+    )
+
+
+class SpooledBody:
+    """
+    缓冲在内存或临时文件中的请求体
+    不超过 GATEWAY_BODY_SPOOL_BYTES 时保存在内存中，超过后转存到临时文件，文件操作都在线程池中执行
+    作为 httpx 的 content 使用，每次迭代都从头读取，因此可以重发
+    """
+
+    def __init__(self):
+        self.size = 0
+        self._memory = bytearray()
+        self._file = None
+
+    @property
+    def on_disk(self) -> bool:
+        return self._file is not None
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self._file is None and self.size <= settings.GATEWAY_BODY_SPOOL_BYTES:
+            self._memory += chunk
+            return
+        if self._file is None:
+            self._file = await asyncio.to_thread(tempfile.TemporaryFile)
+            chunk, self._memory = bytes(self._memory) + chunk, bytearray()
+        await asyncio.to_thread(self._file.write, chunk)
+
+    def getvalue(self) -> bytes:
+        """内存中的请求体"""
+        return bytes(self._memory)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        if self._file is None:
+            for offset in range(0, len(self._memory), CHUNK_SIZE):
+                yield bytes(self._memory[offset:offset + CHUNK_SIZE])
+            return
+        await asyncio.to_thread(self._file.seek, 0)
+        while True:
+            chunk = await asyncio.to_thread(self._file.read, CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self._memory = bytearray()
+        if self._file is not None:
+            self._file.close()
+
+
+async def read_request_body(request: Request, limit: int) -> Union[bytes, SpooledBody]:
+    """
+    读取请求体并检查上限
+    声明的 Content-Length 超过上限时不读取请求体直接拒绝；未超过阈值的请求体以 bytes 返回
+    """
+    declared = declared_length(request.headers)
+    if declared is not None and exceeds(declared, limit):
+        raise _request_too_large(limit)
+
+    body = SpooledBody()
+    try:
+        async for chunk in request.stream():
+            if exceeds(body.size + len(chunk), limit):
+                raise _request_too_large(limit)
+            await body.write(chunk)
+    except BaseException:
+        body.close()
+        raise
+
+    if body.on_disk:
+        return body
+    return body.getvalue()
+
+
+def check_response_length(headers, limit: int):
+    """上游声明的 Content-Length 超过上限时在读取响应体之前拒绝"""
+    declared = declared_length(headers)
+    if declared is not None and exceeds(declared, limit):
+        _response_rejected.inc()
+        raise BodyTooLarge(f"Upstream response exceeds {limit} bytes")
+
+
+async def limit_chunks(chunks: AsyncIterator[bytes], limit: int) -> AsyncIterator[bytes]:
+    """逐块计数，超过上限时中断（流式响应此时已发出响应头，下游连接被断开）"""
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if exceeds(received, limit):
+            _response_rejected.inc()
+            raise BodyTooLarge(f"Upstream response exceeds {limit} bytes")
+        yield chunk
@@ -2,12 +2,14 @@
 API 网关 - Gateway Service
 负责路由请求到注册的微服务
 """
-from fastapi import FastAPI, Request, Response, HTTPException, status, Depends
+from fastapi import FastAPI, Request, Response, HTTPException, status, Depends, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import httpx
+import asyncio
 import sys
 import os
+import time
 from typing import Optional
 from datetime import datetime
 
@@ -15,6 +17,36 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from shared.config import get_settings
+from shared import tracing
+from shared.tracing import instrument_tracing
+from shared.metrics import counter, gauge, histogram, instrument_app, label_service
+from gateway.upstream import UpstreamPool
+from gateway.snapshot import RoutingSnapshot
+from gateway.body import (
+    BodyTooLarge,
+    SpooledBody,
+    body_limits,
+    check_response_length,
+    declared_length,
+    read_request_body,
+)
+from gateway.admission import (
+    ANONYMOUS_TENANT,
+    AdmissionController,
+    admission_key,
+    route_of,
+    tenant_of_request,
+)
+from gateway.tenant_config import GatewayTenantConfigs
+from shared.tenant_config import TENANT_CONFIG_VERSION_HEADER, TENANT_ID_HEADER
+from gateway.streaming import (
+    filter_headers,
+    is_streaming_response,
+    RelayResponse,
+    relay_websocket,
+    stream_slots,
+    websocket_target,
+)
 
 settings = get_settings()
 
@@ -34,14 +66,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求指标与 /metrics 端点
+instrument_app(app)
+
+# 分布式追踪
+instrument_tracing(app, "gateway", edge=True)
+
+discovery_cache_requests = counter(
+    "gateway_discovery_cache_total",
+    "Service discovery cache lookups by result",
+    ("result",),
+)
+_discovery_hit = discovery_cache_requests.labels("hit")
+_discovery_miss = discovery_cache_requests.labels("miss")
+_discovery_error = discovery_cache_requests.labels("error")
+
+upstream_duration = histogram(
+    "gateway_upstream_duration_seconds",
+    "Time from sending a request upstream to receiving response headers",
+    ("service", "status"),
+)
+
 
 class ServiceDiscovery:
-    """服务发现客户端"""
+    """
+    服务发现客户端
+    启动时先从本地路由快照加载，缓存过期后在后台刷新并继续使用旧数据，
+    注册中心不可用时路由保持可用
+    """
 
     def __init__(self):
         self.registry_url = settings.REGISTRY_URL
         self.services_cache = {}
         self.cache_updated_at = None
+        self.snapshot = None
+        if settings.GATEWAY_ROUTING_SNAPSHOT_PATH:
+            self.snapshot = RoutingSnapshot(settings.GATEWAY_ROUTING_SNAPSHOT_PATH)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._refreshing: Optional[asyncio.Task] = None
+
+    def load_snapshot(self) -> bool:
+        """从本地快照恢复路由表"""
+        if self.snapshot is None:
+            return False
+        loaded = self.snapshot.load()
+        if loaded is None:
+            return False
+        self.services_cache, saved_at = loaded
+        self.cache_updated_at = datetime.utcfromtimestamp(saved_at)
+        print(f"✓ 从路由快照加载 {len(self.services_cache)} 个服务")
+        return True
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=settings.GATEWAY_UPSTREAM_CONNECT_TIMEOUT)
+        return self._client
 
     async def get_services(self, force_refresh: bool = False):
         """获取所有活跃服务"""
@@ -49,32 +129,92 @@ class ServiceDiscovery:
         if (
             not force_refresh
             and self.cache_updated_at
-            and (datetime.utcnow() - self.cache_updated_at).seconds < 30
+            and (datetime.utcnow() - self.cache_updated_at).total_seconds() < 30
         ):
+            _discovery_hit.inc()
             return self.services_cache
 
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(f"{self.registry_url}/api/registry/services")
-                if response.status_code == 200:
-                    services = response.json()
-                    self.services_cache = {s["name"]: s for s in services}
-                    self.cache_updated_at = datetime.utcnow()
-                    return self.services_cache
-            except Exception as e:
-                print(f"Error fetching services: {e}")
-                return self.services_cache
+        _discovery_miss.inc()
+        if self.services_cache and not force_refresh:
+            # 已有路由（包括快照）时后台刷新，请求不等待注册中心
+            self.refresh_in_background()
+            return self.services_cache
+        return await self.refresh()
 
-        return {}
+    def refresh_in_background(self):
+        """启动后台刷新，同一时间只有一个刷新任务"""
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self.refresh())
+
+    async def refresh(self):
+        """从注册中心拉取服务列表，成功后更新缓存并写入快照"""
+        try:
+            response = await self.client.get(
+                f"{self.registry_url}/api/registry/services",
+                params={"tag": settings.gateway_discovery_tags_list},
+            )
+            if response.status_code == 200:
+                services = response.json()
+                self.services_cache = {s["name"]: s for s in services}
+                self.cache_updated_at = datetime.utcnow()
+                # 空列表不覆盖快照，避免注册中心异常时清空本地路由
+                if self.snapshot is not None and self.services_cache:
+                    await asyncio.to_thread(self.snapshot.save, self.services_cache)
+            else:
+                _discovery_error.inc()
+        except Exception as e:
+            _discovery_error.inc()
+            print(f"Error fetching services: {e}")
+        return self.services_cache
+
+    def cache_age(self) -> float:
+        """缓存距上次成功刷新的秒数"""
+        if self.cache_updated_at is None:
+            return -1
+        return (datetime.utcnow() - self.cache_updated_at).total_seconds()
 
     async def find_service(self, service_name: str):
         """查找服务"""
         services = await self.get_services()
         return services.get(service_name)
 
+    async def aclose(self):
+        if self._refreshing is not None:
+            self._refreshing.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+
+
+# 租户配置缓存，转发请求时附带配置版本号
+tenant_configs = GatewayTenantConfigs(settings.GATEWAY_CORE_URL)
 
-# 创建服务发现实例
+# 创建服务发现实例，先使用本地快照中的路由
 service_discovery = ServiceDiscovery()
+service_discovery.load_snapshot()
+gauge(
+    "gateway_discovery_cache_age_seconds",
+    "Seconds since the service cache was last refreshed (-1 if never)",
+).set_function(service_discovery.cache_age)
+
+# 上游连接池（所有请求共享长连接）
+upstream_pool = UpstreamPool()
+
+# 准入控制
+admission = AdmissionController()
+
+
+@app.on_event("startup")
+async def startup_event():
+    """启动后立即与注册中心对账，不阻塞启动"""
+    service_discovery.refresh_in_background()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """关闭时释放上游连接"""
+    await service_discovery.aclose()
+    await upstream_pool.aclose()
+    await tenant_configs.aclose()
 
 
 @app.get("/")
@@ -112,13 +252,16 @@ async def proxy_request(
     路由格式: /api/{service_name}/{path}
     """
     # 查找服务
-    service = await service_discovery.find_service(service_name)
+    with tracing.start_span("discovery.lookup") as span:
+        span.set_attribute("service.name", service_name)
+        service = await service_discovery.find_service(service_name)
 
     if not service:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Service '{service_name}' not found or not available",
         )
+    label_service(request, service_name)
 
     if not service.get("is_active"):
         raise HTTPException(
@@ -126,52 +269,216 @@ async def proxy_request(
             detail=f"Service '{service_name}' is not active",
         )
 
+    tenant = tenant_of_request(request)
+
+    # 获取请求体（边接收边检查上限，较大的请求体缓冲到临时文件）
+    # 在准入之前读取：超限的请求直接返回 413，不占用并发额度，也不计入上游的延迟样本
+    request_limit, response_limit = body_limits(service)
+    body = await read_request_body(request, request_limit)
+
+    try:
+        # 准入控制：超出并发上限时快速拒绝
+        ticket = None
+        if settings.GATEWAY_ADMISSION_ENABLED:
+            ticket = admission.admit(
+                service_name,
+                route_of(request.method, path),
+                admission_key(request, tenant),
+                admission.is_priority(path),
+            )
+
+        try:
+            return await _forward(service, path, request, body, response_limit, ticket, tenant)
+        finally:
+            if ticket is not None:
+                ticket.release()
+    finally:
+        if isinstance(body, SpooledBody):
+            body.close()
+
+
+async def _forward(
+    service: dict,
+    path: str,
+    request: Request,
+    body,
+    response_limit: int,
+    ticket=None,
+    tenant: str = ANONYMOUS_TENANT,
+):
+    """转发请求到上游并返回响应，body 为已读取的请求体（bytes 或 SpooledBody）"""
     # 构建目标URL
     service_url = service["url"].rstrip("/")
     target_url = f"{service_url}/{path}"
 
-    # 获取请求体
-    body = await request.body()
-
     # 获取请求头
-    headers = dict(request.headers)
-    # 移除可能导致问题的头
+    # 逐跳头部（含 Transfer-Encoding）不转发，请求体的长度由网关重新声明
+    headers = filter_headers(request.headers)
     headers.pop("host", None)
     headers.pop("content-length", None)
 
+    # 租户及其配置版本由网关填写，不信任客户端传入的值
+    headers.pop(TENANT_ID_HEADER, None)
+    headers.pop(TENANT_CONFIG_VERSION_HEADER, None)
+    if tenant != ANONYMOUS_TENANT and tenant_configs.enabled:
+        headers[TENANT_ID_HEADER] = tenant
+        version = await tenant_configs.version_of(tenant, request.headers["authorization"])
+        if version is not None:
+            headers[TENANT_CONFIG_VERSION_HEADER] = str(version)
+
+    if isinstance(body, SpooledBody):
+        headers["content-length"] = str(body.size)
+
+    # SSE 请求使用空闲超时代替普通读超时
+    timeout = None
+    if "text/event-stream" in request.headers.get("accept", ""):
+        timeout = httpx.Timeout(
+            settings.GATEWAY_STREAM_IDLE_TIMEOUT,
+            connect=settings.GATEWAY_UPSTREAM_CONNECT_TIMEOUT,
+        )
+
     # 转发请求
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    if ticket is not None:
+        ticket.start()
+    upstream_span = tracing.start_span("upstream.request", tracing.SPAN_KIND_CLIENT)
+    extensions = {}
+    if upstream_span.recording:
+        headers["traceparent"] = upstream_span.traceparent()
+        upstream_span.set_attribute("http.url", target_url)
+        # 连接建立、发送请求头等阶段记录为 span 事件
+        extensions["trace"] = tracing.httpx_trace_hook(upstream_span)
+    elif settings.TRACING_ENABLED and "traceparent" in headers:
+        # 网关未采样时不把客户端的采样标志传给上游
+        parent = tracing.unsampled_traceparent(headers.pop("traceparent"))
+        if parent:
+            headers["traceparent"] = parent
+
+    started = time.perf_counter()
+    upstream_status = "error"
+    try:
         try:
-            response = await client.request(
-                method=request.method,
-                url=target_url,
-                params=request.query_params,
-                headers=headers,
-                content=body,
+            with upstream_span:
+                upstream = await upstream_pool.send(
+                    service,
+                    method=request.method,
+                    url=target_url,
+                    params=request.query_params,
+                    headers=headers,
+                    content=body,
+                    timeout=timeout,
+                    extensions=extensions,
+                )
+                upstream_span.set_attribute("http.status_code", upstream.response.status_code)
+                upstream_status = str(upstream.response.status_code)
+        except httpx.TimeoutException:
+            upstream_status = "timeout"
+            raise
+        finally:
+            upstream_duration.labels(service["name"], upstream_status).observe(
+                time.perf_counter() - started
             )
+        try:
+            return await _relay(upstream, ticket, response_limit)
+        except BaseException:
+            # 响应交给 RelayResponse 之前出错时关闭上游，归还并发额度
+            await upstream.aclose()
+            raise
+
+    except HTTPException:
+        raise
+    except BodyTooLarge as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=str(e),
+        )
+    except httpx.TimeoutException:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Service request timeout",
+        )
+    except httpx.RequestError as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Error connecting to service: {str(e)}",
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal gateway error: {str(e)}",
+        )
 
-            # 返回响应
-            return Response(
-                content=response.content,
-                status_code=response.status_code,
-                headers=dict(response.headers),
-            )
 
-        except httpx.TimeoutException:
-            raise HTTPException(
-                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
-                detail="Service request timeout",
-            )
-        except httpx.RequestError as e:
-            raise HTTPException(
-                status_code=status.HTTP_502_BAD_GATEWAY,
-                detail=f"Error connecting to service: {str(e)}",
-            )
-        except Exception as e:
+async def _relay(upstream, ticket, response_limit: int) -> Response:
+    """按响应类型缓冲或流式转发上游响应"""
+    if ticket is not None:
+        ticket.observe(upstream.response.status_code)
+    tenant_configs.observe_response(upstream.response.headers)
+    response_headers = filter_headers(upstream.response.headers)
+
+    # 响应体在转发过程中计数，超过上限时中断
+    upstream.max_body_bytes = response_limit
+    check_response_length(upstream.response.headers, response_limit)
+
+    # 流式响应（SSE / 分块传输）逐块透传
+    if is_streaming_response(upstream.response.headers):
+        if not stream_slots.try_acquire():
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Internal gateway error: {str(e)}",
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent streams",
             )
+        # 长连接只计入 GATEWAY_MAX_STREAMS，归还上游并发额度，避免长连接占满普通请求的额度
+        upstream.release_limit()
+        return RelayResponse(
+            upstream,
+            status_code=upstream.response.status_code,
+            headers=response_headers,
+            slot_held=True,
+            span=tracing.start_span("upstream.relay"),
+        )
+
+    # 较大的定长响应逐块透传，不在内存中缓冲
+    length = declared_length(upstream.response.headers)
+    if length is not None and length > settings.GATEWAY_BODY_SPOOL_BYTES:
+        return RelayResponse(
+            upstream,
+            status_code=upstream.response.status_code,
+            headers=response_headers,
+            span=tracing.start_span("upstream.relay"),
+        )
+
+    # 返回响应（保持原始编码，与上游头部一致）
+    try:
+        with tracing.start_span("upstream.relay"):
+            content = await upstream.aread_raw()
+    finally:
+        await upstream.aclose()
+
+    return Response(
+        content=content,
+        status_code=upstream.response.status_code,
+        headers=response_headers,
+    )
+
+
+@app.websocket("/api/{service_name}/{path:path}")
+async def proxy_websocket(
+    websocket: WebSocket,
+    service_name: str,
+    path: str,
+):
+    """
+    代理 WebSocket 连接到对应的微服务
+    路由格式: /api/{service_name}/{path}
+    """
+    service = await service_discovery.find_service(service_name)
+
+    if not service or not service.get("is_active"):
+        # 握手前关闭，客户端收到 403
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    target_url = websocket_target(service["url"], path, websocket.url.query)
+    await relay_websocket(websocket, target_url)
 
 
 @app.post("/gateway/refresh-services")
@@ -10,10 +10,11 @@ backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, backend_dir)
 
 if __name__ == "__main__":
-    import uvicorn
+    from shared.server import run_service
 
     print("启动 API 网关...")
     print("地址: http://localhost:8000")
     print("API 文档: http://localhost:8000/docs")
 
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    # 默认多进程生产模式，开发时使用 python run.py --reload
+    run_service("gateway.main:app", port=8000)
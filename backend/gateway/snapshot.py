@@ -0,0 +1,98 @@
+"""
+路由快照
+将每次被接受的服务发现结果以 msgpack 格式原子写入本地文件，网关启动时先从快照加载路由，
+注册中心缓慢或不可用时仍可立即转发请求，随后再与注册中心对账
+
+文件格式：MAGIC | crc32 (4 字节) | 写入时间 (8 字节 double) | msgpack 负载
+"""
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+import msgpack
+
+MAGIC = b"GWROUTE1"
+_HEADER = struct.Struct("!Id")
+
+
+def encode(services: Dict[str, dict], saved_at: float) -> bytes:
+    payload = msgpack.packb(services, use_bin_type=True)
+    return MAGIC + _HEADER.pack(zlib.crc32(payload), saved_at) + payload
+
+
+def decode(data) -> Optional[Tuple[Dict[str, dict], float]]:
+    """解析快照，格式不符或校验失败时返回 None"""
+    offset = len(MAGIC) + _HEADER.size
+    if len(data) < offset or data[:len(MAGIC)] != MAGIC:
+        return None
+    checksum, saved_at = _HEADER.unpack_from(data, len(MAGIC))
+    payload = memoryview(data)[offset:]
+    try:
+        if zlib.crc32(payload) != checksum:
+            return None
+        services = msgpack.unpackb(payload, raw=False)
+    except (ValueError, msgpack.UnpackException):
+        return None
+    finally:
+        payload.release()
+    if not isinstance(services, dict):
+        return None
+    return services, saved_at
+
+
+class RoutingSnapshot:
+    """本地路由快照文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._last_checksum: Optional[int] = None
+
+    def load(self) -> Optional[Tuple[Dict[str, dict], float]]:
+        """通过内存映射读取快照，返回 (服务表, 写入时间)，不存在或损坏时返回 None"""
+        try:
+            with open(self.path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return None
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    result = decode(mapped)
+                    if result is not None:
+                        self._last_checksum = _HEADER.unpack_from(mapped, len(MAGIC))[0]
+        except OSError:
+            return None
+        if result is None:
+            print(f"⚠ 路由快照无效，已忽略: {self.path}")
+        return result
+
+    def save(self, services: Dict[str, dict]) -> bool:
+        """
+        原子写入快照（临时文件 + fsync + rename），内容未变化时跳过
+        多个 worker 同时写入时各自使用独立的临时文件，读者总能看到完整的文件
+        """
+        data = encode(services, time.time())
+        checksum = zlib.crc32(data[len(MAGIC) + _HEADER.size:])
+        if checksum == self._last_checksum:
+            return False
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".routes-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"✗ 写入路由快照失败: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return False
+
+        self._last_checksum = checksum
+        return True
@@ -0,0 +1,225 @@
+"""
+流式转发 - WebSocket 与 SSE / 分块响应的透传
+"""
+import asyncio
+import time
+from typing import Dict, List, Tuple
+
+from fastapi import WebSocket, status
+from fastapi.responses import StreamingResponse
+
+from shared.config import get_settings
+from shared.tracing import NOOP_SPAN
+
+settings = get_settings()
+
+# 逐跳头部，不应跨代理转发
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+# WebSocket 握手头部，由上游连接自行生成
+WEBSOCKET_HANDSHAKE_HEADERS = {
+    "host",
+    "sec-websocket-key",
+    "sec-websocket-version",
+    "sec-websocket-extensions",
+    "sec-websocket-protocol",
+    "sec-websocket-accept",
+}
+
+
+def filter_headers(headers) -> Dict[str, str]:
+    """去除逐跳头部"""
+    return {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+
+def is_streaming_response(headers) -> bool:
+    """SSE 或没有 Content-Length 的分块响应按流转发"""
+    content_type = headers.get("content-type", "")
+    return content_type.startswith("text/event-stream") or "content-length" not in headers
+
+
+class StreamSlots:
+    """单个 worker 内长连接（WebSocket / SSE）的并发上限"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+
+    def try_acquire(self) -> bool:
+        if self.active >= self.limit:
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+
+
+stream_slots = StreamSlots(settings.GATEWAY_MAX_STREAMS)
+
+
+async def relay_stream(upstream):
+    """
+    逐块转发上游响应体
+    每个分块在下游写出后才读取下一块，单连接内存占用以一个网络分块为上限
+    """
+    async for chunk in upstream.aiter_raw():
+        yield chunk
+
+
+class RelayResponse(StreamingResponse):
+    """
+    流式转发上游响应
+    无论正常结束、下游提前断开（响应体生成器可能从未启动）还是出错，都会关闭上游响应并归还长连接额度
+    """
+
+    def __init__(self, upstream, status_code: int, headers: Dict[str, str], slot_held: bool = False, span=NOOP_SPAN):
+        super().__init__(relay_stream(upstream), status_code=status_code, headers=headers)
+        self.upstream = upstream
+        self.slot_held = slot_held
+        self.span = span
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            self.span.end()
+            await self.upstream.aclose()
+            if self.slot_held:
+                stream_slots.release()
+
+
+def websocket_target(service_url: str, path: str, query: str) -> str:
+    """将服务的 http(s) 地址转换为 ws(s) 地址"""
+    if service_url.startswith("https://"):
+        target = "wss://" + service_url[len("https://"):]
+    else:
+        target = "ws://" + service_url[len("http://"):]
+    target = f"{target.rstrip('/')}/{path}"
+    return f"{target}?{query}" if query else target
+
+
+def _upstream_headers(websocket: WebSocket) -> List[Tuple[str, str]]:
+    return [
+        (k, v)
+        for k, v in websocket.headers.items()
+        if k.lower() not in HOP_BY_HOP_HEADERS and k.lower() not in WEBSOCKET_HANDSHAKE_HEADERS
+    ]
+
+
+async def relay_websocket(websocket: WebSocket, target_url: str):
+    """
+    双向透传 WebSocket
+    消息大小与上游接收队列受配置限制，任一方向空闲超时后关闭连接
+    """
+    # websockets 只在有 WebSocket 连接时加载
+    import websockets
+    from websockets.asyncio.client import connect as websocket_connect
+
+    if not stream_slots.try_acquire():
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    try:
+        try:
+            upstream = await websocket_connect(
+                target_url,
+                additional_headers=_upstream_headers(websocket),
+                subprotocols=websocket.scope.get("subprotocols") or None,
+                open_timeout=settings.GATEWAY_UPSTREAM_CONNECT_TIMEOUT,
+                max_size=settings.GATEWAY_WS_MAX_MESSAGE_BYTES,
+                max_queue=settings.GATEWAY_WS_MAX_QUEUE,
+            )
+        except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake):
+            await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+            return
+
+        async with upstream:
+            await websocket.accept(subprotocol=upstream.subprotocol)
+            await _pump(websocket, upstream)
+    finally:
+        stream_slots.release()
+
+
+def _close_code(code) -> int:
+    """1005 / 1006 是保留状态码，不能在关闭帧中发送"""
+    if code is None or code in (1005, 1006):
+        return status.WS_1000_NORMAL_CLOSURE
+    return code
+
+
+async def _pump(websocket: WebSocket, upstream):
+    from websockets import ConnectionClosed
+
+    last_activity = time.monotonic()
+
+    async def client_to_upstream():
+        nonlocal last_activity
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                await upstream.close(code=_close_code(message.get("code")))
+                return
+            data = message.get("bytes")
+            if data is None:
+                data = message.get("text")
+                # 文本帧按 UTF-8 编码后的字节数计算
+                size = len(data.encode())
+            else:
+                size = len(data)
+            if size > settings.GATEWAY_WS_MAX_MESSAGE_BYTES:
+                await websocket.close(code=status.WS_1009_MESSAGE_TOO_BIG)
+                await upstream.close(code=status.WS_1009_MESSAGE_TOO_BIG)
+                return
+            last_activity = time.monotonic()
+            await upstream.send(data)
+
+    async def upstream_to_client():
+        nonlocal last_activity
+        try:
+            async for data in upstream:
+                last_activity = time.monotonic()
+                if isinstance(data, bytes):
+                    await websocket.send_bytes(data)
+                else:
+                    await websocket.send_text(data)
+        except ConnectionClosed:
+            pass
+        await websocket.close(code=_close_code(upstream.close_code))
+
+    async def idle_watchdog():
+        timeout = settings.GATEWAY_STREAM_IDLE_TIMEOUT
+        while True:
+            idle = time.monotonic() - last_activity
+            if idle >= timeout:
+                await websocket.close(code=status.WS_1001_GOING_AWAY)
+                await upstream.close(code=status.WS_1001_GOING_AWAY)
+                return
+            await asyncio.sleep(timeout - idle)
+
+    tasks = [
+        asyncio.create_task(client_to_upstream()),
+        asyncio.create_task(upstream_to_client()),
+        asyncio.create_task(idle_watchdog()),
+    ]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                # 对端已断开时关闭连接会抛出异常，无需处理
+                pass
@@ -0,0 +1,129 @@
+"""
+网关的租户配置缓存
+过期条目向 core 发起条件请求（If-None-Match），版本未变时 core 返回 304；
+转发请求时附带 X-Tenant-Id 和 X-Tenant-Config-Version，插件据此判断自己的缓存是否过期
+
+core 不可用时在一个 TTL 内不再请求，期间转发的请求不带版本号，插件退回按 TTL 校验；
+core 返回 401 / 403（按租户和令牌）或 404（按租户）后同样在一个 TTL 内不再请求
+"""
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import httpx
+
+from shared.config import get_settings
+from shared.tenant_config import (
+    TENANT_CONFIG_VERSION_HEADER,
+    TENANT_ID_HEADER,
+    TenantConfig,
+    TenantConfigCache,
+)
+
+settings = get_settings()
+
+
+class CoreUnavailable(Exception):
+    pass
+
+
+class GatewayTenantConfigs:
+    def __init__(self, core_url: str):
+        self.core_url = core_url.rstrip("/")
+        self.cache = TenantConfigCache(
+            self._fetch,
+            ttl=settings.TENANT_CONFIG_TTL_SECONDS,
+            maxsize=settings.TENANT_CONFIG_CACHE_SIZE,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._unavailable_until = 0.0
+        # (租户, 令牌) -> 拒绝到期时间，令牌为 None 表示租户不存在
+        self._denied: "OrderedDict[Tuple[str, Optional[str]], float]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.core_url)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.core_url,
+                timeout=settings.GATEWAY_UPSTREAM_CONNECT_TIMEOUT,
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+            )
+        return self._client
+
+    async def _fetch(
+        self,
+        tenant_id: str,
+        cached: Optional[TenantConfig],
+        authorization: str,
+    ) -> Optional[TenantConfig]:
+        # 使用请求方自己的令牌，core 只返回其有权读取的租户配置
+        headers = {"authorization": authorization}
+        if cached is not None:
+            headers["if-none-match"] = cached.etag
+        try:
+            response = await self.client.get(f"/tenants/{tenant_id}/config", headers=headers)
+        except httpx.HTTPError as e:
+            raise CoreUnavailable(str(e))
+
+        if response.status_code == 304:
+            return cached
+        if response.status_code == 200:
+            data = response.json()
+            return TenantConfig(tenant_id, data["version"], data["config"])
+        if response.status_code == 404:
+            self._deny(tenant_id, None)
+            return None
+        if response.status_code >= 500:
+            raise CoreUnavailable(f"HTTP {response.status_code}")
+        # 401 / 403：令牌过期或无权读取，不影响缓存中的条目
+        self._deny(tenant_id, authorization)
+        raise PermissionError(response.status_code)
+
+    def _deny(self, tenant_id: str, authorization: Optional[str]):
+        key = (tenant_id, authorization)
+        self._denied[key] = time.monotonic() + self.cache.ttl
+        self._denied.move_to_end(key)
+        while len(self._denied) > self.cache.maxsize:
+            self._denied.popitem(last=False)
+
+    def _is_denied(self, tenant_id: str, authorization: str) -> bool:
+        now = time.monotonic()
+        for key in ((tenant_id, None), (tenant_id, authorization)):
+            until = self._denied.get(key)
+            if until is None:
+                continue
+            if now < until:
+                return True
+            del self._denied[key]
+        return False
+
+    async def version_of(self, tenant_id: str, authorization: str) -> Optional[int]:
+        """租户配置的当前版本号，无法确定时返回 None（不阻断请求转发）"""
+        if time.monotonic() < self._unavailable_until:
+            return None
+        if self._is_denied(tenant_id, authorization):
+            return None
+        try:
+            entry = await self.cache.get(tenant_id, authorization)
+        except CoreUnavailable as e:
+            print(f"✗ 读取租户配置失败: {e}")
+            self._unavailable_until = time.monotonic() + self.cache.ttl
+            return None
+        except PermissionError:
+            return None
+        return entry.version if entry is not None else None
+
+    def observe_response(self, headers: httpx.Headers):
+        """经网关的配置读写响应带有最新版本号，本 worker 的缓存随之失效"""
+        tenant_id = headers.get(TENANT_ID_HEADER)
+        version = headers.get(TENANT_CONFIG_VERSION_HEADER)
+        if tenant_id and version and version.isdigit():
+            self.cache.observe(tenant_id, int(version))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
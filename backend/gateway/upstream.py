@@ -0,0 +1,190 @@
+"""
+上游连接池 - 网关到插件服务的 HTTP 连接管理
+复用长连接，可选 HTTP/2 (h2c) 多路复用，并限制每个上游的并发流数
+"""
+import asyncio
+from typing import Dict, Optional, Set
+from urllib.parse import urlsplit
+
+import httpx
+from fastapi import HTTPException, status
+
+from shared.config import get_settings
+from gateway.body import limit_chunks
+
+settings = get_settings()
+
+# h2c 握手失败后可以用 HTTP/1.1 重发的方法
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class UpstreamPool:
+    """上游 HTTP 客户端池"""
+
+    def __init__(self):
+        self.timeout = httpx.Timeout(
+            settings.GATEWAY_UPSTREAM_TIMEOUT,
+            connect=settings.GATEWAY_UPSTREAM_CONNECT_TIMEOUT,
+        )
+        self._http1_client: Optional[httpx.AsyncClient] = None
+        self._http2_client: Optional[httpx.AsyncClient] = None
+        # h2c 握手失败、已回退到 HTTP/1.1 的上游
+        self._http1_only: Set[str] = set()
+        # 已成功使用 HTTP/2 通信的上游（不再回退）
+        self._http2_confirmed: Set[str] = set()
+        self._stream_limits: Dict[str, asyncio.Semaphore] = {}
+
+    @staticmethod
+    def origin_of(url: str) -> str:
+        """上游标识（scheme://host:port）"""
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _get_http1_client(self) -> httpx.AsyncClient:
+        if self._http1_client is None:
+            self._http1_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=settings.GATEWAY_UPSTREAM_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.GATEWAY_UPSTREAM_MAX_CONNECTIONS,
+                ),
+            )
+        return self._http1_client
+
+    def _get_http2_client(self) -> httpx.AsyncClient:
+        if self._http2_client is None:
+            # http1=False 时对 http:// 上游使用 prior knowledge h2c
+            self._http2_client = httpx.AsyncClient(
+                http1=False,
+                http2=True,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=settings.GATEWAY_UPSTREAM_HTTP2_CONNECTIONS,
+                    max_keepalive_connections=settings.GATEWAY_UPSTREAM_HTTP2_CONNECTIONS,
+                ),
+            )
+        return self._http2_client
+
+    def _wants_http2(self, service: dict, origin: str) -> bool:
+        """服务元数据中的 http2 字段优先于全局配置"""
+        if origin in self._http1_only:
+            return False
+        metadata = service.get("service_metadata") or {}
+        return bool(metadata.get("http2", settings.GATEWAY_UPSTREAM_HTTP2))
+
+    def _stream_limit(self, origin: str) -> asyncio.Semaphore:
+        limit = self._stream_limits.get(origin)
+        if limit is None:
+            limit = asyncio.Semaphore(settings.GATEWAY_UPSTREAM_MAX_STREAMS)
+            self._stream_limits[origin] = limit
+        return limit
+
+    async def send(
+        self,
+        service: dict,
+        method: str,
+        url: str,
+        timeout: Optional[httpx.Timeout] = None,
+        **kwargs,
+    ) -> "UpstreamResponse":
+        """
+        向上游发送请求并以流式方式返回响应，h2c 不可用时回退到 HTTP/1.1
+        调用方读取完响应体后必须调用 aclose() 归还并发额度
+        """
+        origin = self.origin_of(url)
+        limit = self._stream_limit(origin)
+        try:
+            # wait_for 在取消与获取竞争时可能丢失已获取的额度，asyncio.timeout 直接取消等待中的 acquire
+            async with asyncio.timeout(settings.GATEWAY_UPSTREAM_QUEUE_TIMEOUT):
+                await limit.acquire()
+        except TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Upstream is busy",
+                headers={"Retry-After": str(settings.GATEWAY_ADMISSION_RETRY_AFTER)},
+            )
+
+        try:
+            response = await self._send(service, origin, method, url, timeout, **kwargs)
+        except BaseException:
+            limit.release()
+            raise
+
+        return UpstreamResponse(response, limit)
+
+    async def _send(self, service, origin, method, url, timeout, **kwargs) -> httpx.Response:
+        timeout = timeout or self.timeout
+
+        if self._wants_http2(service, origin):
+            client = self._get_http2_client()
+            try:
+                return await client.send(
+                    client.build_request(method, url, timeout=timeout, **kwargs),
+                    stream=True,
+                )
+            except (httpx.RemoteProtocolError, httpx.ReadError):
+                # 上游不支持 h2c 时会直接断开或返回 HTTP/1.1 错误
+                if origin in self._http2_confirmed:
+                    raise
+                self._http1_only.add(origin)
+                # 请求可能已被上游执行，非幂等请求不重发（返回 502），后续请求改用 HTTP/1.1
+                if method.upper() not in SAFE_METHODS:
+                    raise
+            else:
+                self._http2_confirmed.add(origin)
+
+        client = self._get_http1_client()
+        return await client.send(
+            client.build_request(method, url, timeout=timeout, **kwargs),
+            stream=True,
+        )
+
+    async def aclose(self):
+        """关闭所有上游连接"""
+        for client in (self._http1_client, self._http2_client):
+            if client is not None:
+                await client.aclose()
+        self._http1_client = None
+        self._http2_client = None
+
+
+class UpstreamResponse:
+    """流式上游响应，关闭时归还并发额度"""
+
+    def __init__(self, response: httpx.Response, limit: asyncio.Semaphore):
+        self.response = response
+        self._limit = limit
+        self._limit_released = False
+        self._closed = False
+        # 响应体上限（字节），0 为不限制，超过时 aiter_raw 抛出 BodyTooLarge
+        self.max_body_bytes = 0
+
+    async def aiter_raw(self):
+        """按原样转发响应体分块（不解压、不合并）"""
+        chunks = self.response.aiter_raw()
+        if self.max_body_bytes > 0:
+            chunks = limit_chunks(chunks, self.max_body_bytes)
+        async for chunk in chunks:
+            yield chunk
+
+    async def aread_raw(self) -> bytes:
+        """读取完整的原始响应体"""
+        return b"".join([chunk async for chunk in self.aiter_raw()])
+
+    def release_limit(self):
+        """
+        提前归还上游并发额度
+        SSE 等长连接改由 StreamSlots 计数，不占用上游的 GATEWAY_UPSTREAM_MAX_STREAMS
+        """
+        if not self._limit_released:
+            self._limit_released = True
+            self._limit.release()
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await self.response.aclose()
+        finally:
+            self.release_limit()
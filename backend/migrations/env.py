@@ -0,0 +1,47 @@
+"""
+Alembic 迁移环境
+"""
+from logging.config import fileConfig
+
+from alembic import context
+
+from shared.config import get_settings
+from shared.database import Base
+import shared.models  # noqa: F401  注册所有模型到 Base.metadata
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline() -> None:
+    """生成 SQL 脚本而不连接数据库"""
+    context.configure(
+        url=get_settings().DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    """在数据库连接上执行迁移（复用 shared.database 的主库引擎）"""
+    from shared.database import engine
+
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,39 @@
+"""服务标签和元数据改为 JSONB 并建立 GIN 索引（仅 PostgreSQL）
+
+支持 tags ? 'demo'、tags @> '["demo"]'、metadata @> '{"category": "billing"}' 等查询
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 10:05:12.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.alter_column('services', 'tags', type_=postgresql.JSONB(), postgresql_using='tags::jsonb')
+    op.alter_column('services', 'metadata', type_=postgresql.JSONB(), postgresql_using='metadata::jsonb')
+    op.create_index('ix_services_tags', 'services', ['tags'], postgresql_using='gin')
+    op.create_index('ix_services_metadata', 'services', ['metadata'], postgresql_using='gin')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_services_metadata', table_name='services')
+    op.drop_index('ix_services_tags', table_name='services')
+    op.alter_column('services', 'metadata', type_=sa.JSON(), postgresql_using='metadata::json')
+    op.alter_column('services', 'tags', type_=sa.JSON(), postgresql_using='tags::json')
@@ -0,0 +1,27 @@
+"""租户配置版本号，配置每次修改时加一，用于各服务的配置缓存校验
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 16:20:41.902731
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('tenants', sa.Column('config_version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('tenants') as batch_op:
+        batch_op.drop_column('config_version')
@@ -2,7 +2,7 @@
 服务注册中心 - Registry Service
 负责微服务的注册、发现和健康检查
 """
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from typing import List
@@ -14,7 +14,10 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from shared.config import get_settings
-from shared.database import get_db, Base, engine
+from shared.tracing import instrument_tracing
+from shared.query_stats import instrument_query_stats
+from shared.metrics import histogram, instrument_app
+from shared.database import SessionLocal, get_db, check_schema_version
 from shared.models import Service, ServiceEndpoint
 from shared.schemas.service import (
     ServiceRegister,
@@ -22,6 +25,7 @@ from shared.schemas.service import (
     ServiceHeartbeat,
     ServiceUpdate,
 )
+from registry.state import registry_state
 
 settings = get_settings()
 
@@ -41,11 +45,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求指标与 /metrics 端点
+instrument_app(app)
+
+# 分布式追踪
+instrument_tracing(app, "registry")
+
+# 请求级数据库耗时（Server-Timing）与慢查询日志
+instrument_query_stats(app)
+
+heartbeat_lag = histogram(
+    "registry_heartbeat_lag_seconds",
+    "Seconds between consecutive heartbeats of a service",
+    buckets=(1, 5, 10, 15, 30, 45, 60, 90, 120, 300, 600),
+)
+
 
 @app.on_event("startup")
 async def startup_event():
-    """启动时创建数据库表"""
-    Base.metadata.create_all(bind=engine)
+    """启动时校验数据库结构版本（建表由迁移命令完成），加载服务状态到内存"""
+    check_schema_version()
+    db = SessionLocal()
+    try:
+        registry_state.load(db)
+    finally:
+        db.close()
+    registry_state.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """关闭前写回排队的心跳"""
+    await registry_state.stop()
 
 
 @app.get("/")
@@ -89,7 +120,7 @@ async def register_service(
 
         db.commit()
         db.refresh(existing_service)
-        return existing_service
+        return registry_state.put(existing_service)
 
     # 创建新服务
     service = Service(**service_data.dict(exclude={"endpoints"}))
@@ -107,7 +138,7 @@ async def register_service(
 
     db.commit()
     db.refresh(service)
-    return service
+    return registry_state.put(service)
 
 
 @app.post("/api/registry/heartbeat")
@@ -117,22 +148,47 @@ async def service_heartbeat(
 ):
     """
     服务心跳
+    只更新内存并排队批量写回数据库；携带元数据时立即写入
     """
-    service = db.query(Service).filter(Service.id == heartbeat.service_id).first()
+    record = registry_state.get(heartbeat.service_id)
+
+    if record is None:
+        # 可能是其他 worker 刚注册、尚未同步到本 worker 的服务
+        service = db.query(Service).filter(Service.id == heartbeat.service_id).first()
+        if not service:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Service not found",
+            )
+        record = registry_state.put(service)
+
+    now = datetime.now(timezone.utc)
+    if record.last_heartbeat is not None:
+        previous = record.last_heartbeat
+        if previous.tzinfo is None:
+            previous = previous.replace(tzinfo=timezone.utc)
+        heartbeat_lag.observe((now - previous).total_seconds())
 
+    if not heartbeat.service_metadata:
+        registry_state.heartbeat(record.id, now)
+        return {"status": "ok", "message": "Heartbeat received"}
+
+    service = db.query(Service).filter(Service.id == record.id).first()
     if not service:
+        registry_state.remove(record.id)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Service not found",
         )
 
-    service.last_heartbeat = datetime.now(timezone.utc)
+    service.last_heartbeat = now
     service.is_active = True
-
-    if heartbeat.metadata:
-        service.service_metadata.update(heartbeat.metadata)
+    # JSON 列原地修改不会被 SQLAlchemy 追踪，需要赋新值
+    service.service_metadata = {**(service.service_metadata or {}), **heartbeat.service_metadata}
 
     db.commit()
+    db.refresh(service)
+    registry_state.put(service)
 
     return {"status": "ok", "message": "Heartbeat received"}
 
@@ -155,6 +211,8 @@ async def deregister_service(
 
     service.is_active = False
     db.commit()
+    db.refresh(service)
+    registry_state.put(service)
 
     return {"status": "ok", "message": "Service deregistered"}
 
@@ -162,29 +220,27 @@ async def deregister_service(
 @app.get("/api/registry/services", response_model=List[ServiceResponse])
 async def list_services(
     active_only: bool = True,
-    db: Session = Depends(get_db),
+    tag: List[str] = Query(default=[]),
+    meta: List[str] = Query(default=[]),
 ):
     """
-    获取所有服务列表
+    获取所有服务列表（由内存状态返回）
+    可按标签（tag=demo）和元数据（meta=category:billing，只写键时要求存在该键）过滤，
+    多个条件同时满足
     """
-    query = db.query(Service)
-
-    if active_only:
-        query = query.filter(Service.is_active == True)
-
-    services = query.all()
-    return services
+    metadata = []
+    for item in meta:
+        key, sep, value = item.partition(":")
+        metadata.append((key, value if sep else None))
+    return registry_state.list(active_only=active_only, tags=tag, metadata=metadata)
 
 
 @app.get("/api/registry/services/{service_id}", response_model=ServiceResponse)
-async def get_service(
-    service_id: str,
-    db: Session = Depends(get_db),
-):
+async def get_service(service_id: str):
     """
     获取服务详情
     """
-    service = db.query(Service).filter(Service.id == service_id).first()
+    service = registry_state.get(service_id)
 
     if not service:
         raise HTTPException(
@@ -196,14 +252,11 @@ async def get_service(
 
 
 @app.get("/api/registry/services/by-name/{service_name}", response_model=ServiceResponse)
-async def get_service_by_name(
-    service_name: str,
-    db: Session = Depends(get_db),
-):
+async def get_service_by_name(service_name: str):
     """
     根据名称获取服务
     """
-    service = db.query(Service).filter(Service.name == service_name).first()
+    service = registry_state.get_by_name(service_name)
 
     if not service:
         raise HTTPException(
@@ -238,7 +291,7 @@ async def update_service(
     db.commit()
     db.refresh(service)
 
-    return service
+    return registry_state.put(service)
 
 
 @app.delete("/api/registry/services/{service_id}")
@@ -259,6 +312,7 @@ async def delete_service(
 
     db.delete(service)
     db.commit()
+    registry_state.remove(service_id)
 
     return {"status": "ok", "message": "Service deleted"}
 
@@ -268,6 +322,9 @@ async def check_stale_services(db: Session = Depends(get_db)):
     """
     检查过期服务（超过5分钟未发送心跳）
     """
+    # 先写回排队的心跳，避免误判
+    await registry_state.flush()
+
     threshold = datetime.now(timezone.utc) - timedelta(minutes=5)
     stale_services = db.query(Service).filter(
         Service.is_active == True,
@@ -279,6 +336,8 @@ async def check_stale_services(db: Session = Depends(get_db)):
         service.is_active = False
 
     db.commit()
+    for service in stale_services:
+        registry_state.put(service)
 
     return {
         "checked_at": datetime.now(timezone.utc).isoformat(),
@@ -0,0 +1,236 @@
+"""
+注册中心内存状态
+启动时从数据库加载全部服务和端点，读请求直接由内存索引（id / 名称 / 标签 / 元数据倒排索引）返回
+
+写入策略：
+- 注册、更新、注销、删除：先写数据库（write-through），提交后更新内存
+- 不带元数据的心跳：只更新内存并排队，由后台任务批量写回（write-behind）
+
+多 worker 部署时每个 worker 各有一份状态，后台任务定期从数据库重新加载，
+其他 worker 的写入在一个同步周期内可见
+"""
+import asyncio
+import json
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session, selectinload
+
+from shared.config import get_settings
+from shared.database import SessionLocal
+from shared.models import Service
+from shared.schemas.service import ServiceResponse
+
+settings = get_settings()
+
+
+def metadata_terms(metadata: Dict[str, Any]) -> Iterable[Tuple[str, Optional[str]]]:
+    """
+    元数据在倒排索引中的词项：(键, None) 表示存在该键，(键, 值) 表示键值相等
+    字符串按原样比较，数字、布尔等标量按 JSON 文本比较（如 "1"、"true"），嵌套对象只索引键
+    """
+    for key, value in metadata.items():
+        yield key, None
+        if isinstance(value, str):
+            yield key, value
+        elif value is None or isinstance(value, (bool, int, float)):
+            yield key, json.dumps(value)
+
+
+class RegistryState:
+    """服务的内存模型与索引"""
+
+    def __init__(self):
+        self.by_id: Dict[str, ServiceResponse] = {}
+        self.by_name: Dict[str, str] = {}
+        self.by_tag: Dict[str, Set[str]] = defaultdict(set)
+        self.by_metadata: Dict[Tuple[str, Optional[str]], Set[str]] = defaultdict(set)
+        # 待写回数据库的心跳时间
+        self._pending_heartbeats: Dict[str, datetime] = {}
+        # 重新加载期间本地发生的写入，加载完成后覆盖到新状态上（None 表示已删除）
+        self._recent_writes: Optional[Dict[str, Optional[ServiceResponse]]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # ==================== 读取 ====================
+
+    def get(self, service_id: str) -> Optional[ServiceResponse]:
+        return self.by_id.get(service_id)
+
+    def get_by_name(self, name: str) -> Optional[ServiceResponse]:
+        service_id = self.by_name.get(name)
+        return self.by_id.get(service_id) if service_id is not None else None
+
+    def list(
+        self,
+        active_only: bool = True,
+        tags: Iterable[str] = (),
+        metadata: Iterable[Tuple[str, Optional[str]]] = (),
+    ) -> List[ServiceResponse]:
+        """
+        按条件列出服务，所有条件同时满足（AND）
+        tags 为标签列表；metadata 为 (键, 值) 列表，值为 None 时只要求存在该键
+        """
+        postings = [self.by_tag.get(tag, set()) for tag in tags]
+        postings += [self.by_metadata.get(term, set()) for term in metadata]
+        if postings:
+            # 从最短的倒排列表开始求交集
+            postings.sort(key=len)
+            ids = set(postings[0])
+            for other in postings[1:]:
+                if not ids:
+                    break
+                ids &= other
+            services = [self.by_id[i] for i in ids]
+        else:
+            services = list(self.by_id.values())
+        if active_only:
+            services = [s for s in services if s.is_active]
+        return services
+
+    # ==================== 写入 ====================
+
+    def put(self, service: Service) -> ServiceResponse:
+        """写入数据库后调用，以 ORM 对象更新内存"""
+        record = ServiceResponse.model_validate(service)
+        self._index(record)
+        # 数据库中已是最新状态，丢弃排队的心跳，避免写回时覆盖（例如重新激活已注销的服务）
+        self._pending_heartbeats.pop(record.id, None)
+        if self._recent_writes is not None:
+            self._recent_writes[record.id] = record
+        return record
+
+    def remove(self, service_id: str):
+        """数据库删除后调用"""
+        self._unindex(service_id)
+        self._pending_heartbeats.pop(service_id, None)
+        if self._recent_writes is not None:
+            self._recent_writes[service_id] = None
+
+    def heartbeat(self, service_id: str, at: datetime) -> ServiceResponse:
+        """记录心跳（write-behind），返回更新后的记录"""
+        if at.tzinfo is not None:
+            # 与模型默认值一致，使用不带时区的 UTC 时间
+            at = at.astimezone(timezone.utc).replace(tzinfo=None)
+        record = self.by_id[service_id].model_copy(update={"last_heartbeat": at, "is_active": True})
+        self.by_id[service_id] = record
+        self._pending_heartbeats[service_id] = at
+        return record
+
+    def _index(self, record: ServiceResponse):
+        self._unindex(record.id)
+        self.by_id[record.id] = record
+        self.by_name[record.name] = record.id
+        for tag in record.tags:
+            self.by_tag[tag].add(record.id)
+        for term in metadata_terms(record.service_metadata):
+            self.by_metadata[term].add(record.id)
+
+    def _unindex(self, service_id: str):
+        old = self.by_id.pop(service_id, None)
+        if old is None:
+            return
+        if self.by_name.get(old.name) == service_id:
+            del self.by_name[old.name]
+        _discard(self.by_tag, old.tags, service_id)
+        _discard(self.by_metadata, metadata_terms(old.service_metadata), service_id)
+
+    # ==================== 加载与同步 ====================
+
+    @staticmethod
+    def _fetch(db: Session) -> List[ServiceResponse]:
+        services = db.query(Service).options(selectinload(Service.endpoints)).all()
+        return [ServiceResponse.model_validate(s) for s in services]
+
+    def load(self, db: Session):
+        """从数据库加载全部服务，替换当前状态"""
+        self._replace(self._fetch(db))
+
+    def _replace(self, records: List[ServiceResponse]):
+        pending = self._pending_heartbeats
+        self.by_id, self.by_name = {}, {}
+        self.by_tag, self.by_metadata = defaultdict(set), defaultdict(set)
+        for record in records:
+            at = pending.get(record.id)
+            if at is not None and (record.last_heartbeat is None or at > record.last_heartbeat):
+                # 尚未写回的心跳比数据库新
+                record = record.model_copy(update={"last_heartbeat": at, "is_active": True})
+            self._index(record)
+
+    def _reload_sync(self) -> List[ServiceResponse]:
+        with SessionLocal() as db:
+            return self._fetch(db)
+
+    def _flush_sync(self, pending: Dict[str, datetime]):
+        # 使用 Core 语句批量执行（executemany），已删除的服务不会报错
+        table = Service.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("service_id"))
+            .values(last_heartbeat=bindparam("at"), is_active=True)
+        )
+        with SessionLocal() as db:
+            db.execute(statement, [{"service_id": i, "at": at} for i, at in pending.items()])
+            db.commit()
+
+    async def flush(self):
+        """将排队的心跳批量写回数据库，失败时放回队列等待下次重试"""
+        if not self._pending_heartbeats:
+            return
+        pending, self._pending_heartbeats = self._pending_heartbeats, {}
+        try:
+            await asyncio.to_thread(self._flush_sync, pending)
+        except Exception as e:
+            print(f"✗ 心跳写回失败: {e}")
+            for service_id, at in pending.items():
+                if service_id in self.by_id:
+                    self._pending_heartbeats.setdefault(service_id, at)
+
+    async def sync(self):
+        """写回心跳后从数据库重新加载，获取其他 worker 的写入"""
+        await self.flush()
+        self._recent_writes = {}
+        try:
+            records = await asyncio.to_thread(self._reload_sync)
+        except Exception as e:
+            print(f"✗ 重新加载服务状态失败: {e}")
+            return
+        finally:
+            recent, self._recent_writes = self._recent_writes, None
+        self._replace(records)
+        for service_id, record in recent.items():
+            if record is None:
+                self._unindex(service_id)
+            else:
+                self._index(record)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.REGISTRY_STATE_SYNC_SECONDS)
+            await self.sync()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+def _discard(index: Dict[Any, Set[str]], terms: Iterable, service_id: str):
+    for term in terms:
+        ids = index.get(term)
+        if ids is not None:
+            ids.discard(service_id)
+            if not ids:
+                del index[term]
+
+
+registry_state = RegistryState()
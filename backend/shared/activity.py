@@ -0,0 +1,96 @@
+"""
+活动时间戳的合并写入
+登录时间等只需近似准确的字段先记录在内存中，由后台任务定期批量 UPDATE，
+请求路径上不再等待写事务；同一行在一个周期内的多次更新合并为一次
+
+进程异常退出时最多丢失一个 ACTIVITY_FLUSH_SECONDS 周期的时间戳，正常关闭时会先写回
+"""
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import Table, bindparam, or_, update
+
+from .config import get_settings
+from .database import SessionLocal
+from .models import User
+
+settings = get_settings()
+
+
+class ActivityRecorder:
+    """记录某张表某个时间戳列的最新值，定期批量写回"""
+
+    def __init__(self, table: Table, column: str):
+        self.table = table
+        self.column = column
+        self._pending: Dict[str, datetime] = {}
+
+    def touch(self, row_id: str, at: Optional[datetime] = None):
+        """记录活动时间（不带时区的 UTC，与模型默认值一致）"""
+        self._pending[row_id] = at or datetime.utcnow()
+
+    def _flush_sync(self, pending: Dict[str, datetime]):
+        # 多个 worker 各自写回时只允许时间前进，较旧的值不会覆盖较新的值
+        column = self.table.c[self.column]
+        statement = (
+            update(self.table)
+            .where(self.table.c.id == bindparam("row_id"))
+            .where(or_(column.is_(None), column < bindparam("at")))
+            .values({self.column: bindparam("at")})
+        )
+        with SessionLocal() as db:
+            db.execute(statement, [{"row_id": i, "at": at} for i, at in pending.items()])
+            db.commit()
+
+    async def flush(self):
+        """写回排队的时间戳，失败时放回队列等待下次重试"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            await asyncio.to_thread(self._flush_sync, pending)
+        except Exception as e:
+            print(f"✗ {self.table.name}.{self.column} 写回失败: {e}")
+            for row_id, at in pending.items():
+                current = self._pending.get(row_id)
+                if current is None or current < at:
+                    self._pending[row_id] = at
+
+
+last_login = ActivityRecorder(User.__table__, "last_login")
+
+RECORDERS: List[ActivityRecorder] = [last_login]
+
+_task: Optional[asyncio.Task] = None
+
+
+async def flush_all():
+    for recorder in RECORDERS:
+        await recorder.flush()
+
+
+async def _run():
+    while True:
+        await asyncio.sleep(settings.ACTIVITY_FLUSH_SECONDS)
+        await flush_all()
+
+
+def start():
+    """启动后台写回任务（在服务的 startup 事件中调用）"""
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_run())
+
+
+async def stop():
+    """停止后台任务并写回剩余的时间戳"""
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    await flush_all()
@@ -1,20 +1,140 @@
 """
 数据库配置和会话管理
 """
-from sqlalchemy import create_engine
+import random
+import re
+import time
+from contextvars import ContextVar
+from typing import Optional, Tuple
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DisconnectionError, IntegrityError, SQLAlchemyError, TimeoutError as SATimeoutError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
 from .config import get_settings
+from .metrics import counter, gauge, histogram
+from .tracing import instrument_engine
+from .query_stats import instrument_queries
 
 settings = get_settings()
 
-# 创建数据库引擎
-engine = create_engine(
-    settings.DATABASE_URL,
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
+pool_checkout_wait = histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the pool",
 )
+pool_checkout_timeouts = counter(
+    "db_pool_checkout_timeouts_total",
+    "Connection checkouts that timed out waiting for the pool",
+)
+pool_checked_out = gauge(
+    "db_pool_checked_out",
+    "Connections currently checked out of the pool",
+    ("engine",),
+)
+pool_capacity = gauge(
+    "db_pool_capacity",
+    "Maximum connections the pool may open (pool_size + max_overflow)",
+    ("engine",),
+)
+pool_liveness_failures = counter(
+    "db_pool_liveness_failures_total",
+    "Idle connections discarded because the liveness ping failed",
+)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """记录连接检出等待时间的连接池"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except SATimeoutError:
+            pool_checkout_timeouts.inc()
+            raise
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - started)
+
+
+def pool_sizing() -> Tuple[int, int]:
+    """
+    每个进程的 (pool_size, max_overflow)
+    配置了 DB_CONNECTION_BUDGET 时按 worker 数均分，且不再允许溢出
+    """
+    if settings.DB_CONNECTION_BUDGET > 0:
+        return max(settings.DB_CONNECTION_BUDGET // settings.worker_count, 1), 0
+    return settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW
+
+
+def _install_idle_liveness_check(new_engine):
+    """
+    仅对空闲超过阈值的连接做存活检查，代替每次检出都 ping
+    检查失败时抛出 DisconnectionError，连接池会丢弃该连接并重新获取
+    """
+    idle_seconds = settings.DB_POOL_PING_IDLE_SECONDS
+
+    @event.listens_for(new_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(new_engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(new_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get("checked_in_at", 0)
+        if time.monotonic() - checked_in_at < idle_seconds:
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+        except Exception:
+            pool_liveness_failures.inc()
+            raise DisconnectionError()
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+
+def _create_engine(url: str, name: str):
+    """创建数据库引擎并注册追踪、计时钩子"""
+    pool_size, max_overflow = pool_sizing()
+    new_engine = create_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_pre_ping=settings.DB_POOL_PRE_PING == "always",
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
+
+    if settings.DB_POOL_PRE_PING == "idle":
+        _install_idle_liveness_check(new_engine)
+
+    # 连接池饱和度
+    pool_checked_out.labels(name).set_function(new_engine.pool.checkedout)
+    pool_capacity.labels(name).set(pool_size + max_overflow)
+
+    # 为每条 SQL 语句创建追踪 span
+    instrument_engine(new_engine)
+
+    # 语句计时、慢查询日志
+    instrument_queries(new_engine)
+
+    return new_engine
+
+
+# 创建数据库引擎（主库）
+engine = _create_engine(settings.DATABASE_URL, "primary")
+
+# 只读副本
+replica_engines = [
+    _create_engine(url, f"replica{i}") for i, url in enumerate(settings.database_replica_urls_list)
+]
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -23,6 +143,28 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+# 代码所需的数据库结构版本，新增迁移时同步更新为最新的 revision
+SCHEMA_REVISION = "0003"
+
+
+def check_schema_version():
+    """
+    启动时校验数据库结构版本，只查询一次 alembic_version 表
+    建表和变更由迁移命令 python -m shared.migrate 完成
+    """
+    if not settings.DB_SCHEMA_CHECK:
+        return
+    try:
+        with engine.connect() as conn:
+            current = conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    except SQLAlchemyError:
+        current = None
+    if current != SCHEMA_REVISION:
+        raise RuntimeError(
+            f"数据库结构版本为 {current}，需要 {SCHEMA_REVISION}，请先执行 python -m shared.migrate"
+        )
+
+
 def get_db():
     """数据库会话依赖"""
     db = SessionLocal()
@@ -30,3 +172,132 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+_SQLITE_CONSTRAINT = re.compile(r"(?:UNIQUE|NOT NULL) constraint failed: \w+\.(\w+)")
+
+
+def violated_column(error: IntegrityError, table: str) -> Optional[str]:
+    """
+    从完整性错误中取出违反约束的列名，无法识别时返回 None
+    PostgreSQL 使用默认约束名（{表}_{列}_key / {表}_{列}_fkey），SQLite 从错误信息中解析
+    """
+    diag = getattr(error.orig, "diag", None)
+    constraint = getattr(diag, "constraint_name", None)
+    if constraint:
+        match = re.fullmatch(rf"{table}_(\w+?)_f?key", constraint)
+        return match.group(1) if match else None
+    match = _SQLITE_CONSTRAINT.search(str(error.orig))
+    return match.group(1) if match else None
+
+
+# ==================== 读写分离 ====================
+
+
+class _Consistency:
+    """单个请求的读写一致性状态"""
+
+    __slots__ = ("sticky", "wrote")
+
+    def __init__(self, sticky: bool):
+        self.sticky = sticky
+        self.wrote = False
+
+
+_consistency: ContextVar[Optional[_Consistency]] = ContextVar("db_consistency", default=None)
+
+# 写入后在此 Cookie 的有效期内读请求走主库
+STICKY_COOKIE = "db_primary_until"
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _mark_write(session, flush_context):
+    state = _consistency.get()
+    if state is not None:
+        state.wrote = True
+
+
+class RoutingSession(Session):
+    """
+    只读会话：路由到只读副本
+    会话内发生写入、或客户端处于写后粘滞期时使用主库
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or self.info.get("use_primary") or not replica_engines:
+            return engine
+        replica = self.info.get("replica")
+        if replica is None:
+            # 同一会话内固定使用一个副本
+            replica = random.choice(replica_engines)
+            self.info["replica"] = replica
+        return replica
+
+
+ReadSessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+
+
+def get_read_db():
+    """只读数据库会话依赖，仅用于不写库的端点"""
+    db = ReadSessionLocal()
+    state = _consistency.get()
+    if state is not None and state.sticky:
+        db.info["use_primary"] = True
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+class ReadYourWritesMiddleware:
+    """
+    写后读一致性：请求发生写入后下发短期 Cookie，
+    有效期内该客户端的读请求路由到主库，避免读到副本延迟前的旧数据
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        now = time.time()
+        state = _Consistency(sticky=_sticky_until(scope) > now)
+        token = _consistency.set(state)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and state.wrote:
+                seconds = settings.DATABASE_READ_YOUR_WRITES_SECONDS
+                cookie = (
+                    f"{STICKY_COOKIE}={int(now + seconds)}; Max-Age={seconds}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _consistency.reset(token)
+
+
+def _sticky_until(scope) -> float:
+    for key, value in scope["headers"]:
+        if key != b"cookie":
+            continue
+        for part in value.decode("latin-1").split(";"):
+            name, _, raw = part.strip().partition("=")
+            if name == STICKY_COOKIE:
+                try:
+                    return float(raw)
+                except ValueError:
+                    return 0
+    return 0
+
+
+def add_read_your_writes(app):
+    """配置了只读副本时安装写后读一致性中间件"""
+    if replica_engines:
+        app.add_middleware(ReadYourWritesMiddleware)
@@ -0,0 +1,45 @@
+"""
+数据库迁移命令（一次性执行，不在服务启动时运行）
+
+    cd backend && python -m shared.migrate
+
+升级到最新版本。对于此前由 create_all 建表、没有版本记录的数据库，先标记为初始版本再升级
+"""
+import os
+import sys
+
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import inspect
+
+from .database import SCHEMA_REVISION, engine
+
+# 初始迁移的版本号
+BASELINE_REVISION = "0001"
+
+
+def alembic_config() -> Config:
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return Config(os.path.join(backend_dir, "alembic.ini"))
+
+
+def main():
+    config = alembic_config()
+
+    head = ScriptDirectory.from_config(config).get_current_head()
+    if head != SCHEMA_REVISION:
+        print(f"✗ 迁移脚本最新版本为 {head}，但 shared.database.SCHEMA_REVISION 为 {SCHEMA_REVISION}")
+        sys.exit(1)
+
+    tables = set(inspect(engine).get_table_names())
+    if "alembic_version" not in tables and "tenants" in tables:
+        print(f"检测到未纳入迁移管理的已有数据库，标记为版本 {BASELINE_REVISION}")
+        command.stamp(config, BASELINE_REVISION)
+
+    command.upgrade(config, "head")
+    print(f"✓ 数据库结构已是最新版本 {head}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 服务模型 - 热插拔服务注册
 """
 from sqlalchemy import Column, String, Boolean, DateTime, JSON, Integer, ForeignKey, Text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -31,9 +32,9 @@ class Service(Base):
     health_check_url = Column(String(255), nullable=True)
     last_heartbeat = Column(DateTime, default=datetime.utcnow)
 
-    # 服务元数据
-    service_metadata = Column("metadata", JSON, default=dict)  # 自定义元数据
-    tags = Column(JSON, default=list)  # 服务标签
+    # 服务元数据（PostgreSQL 上为 JSONB，带 GIN 索引，支持按标签、元数据查询）
+    service_metadata = Column("metadata", JSON().with_variant(JSONB(), "postgresql"), default=dict)  # 自定义元数据
+    tags = Column(JSON().with_variant(JSONB(), "postgresql"), default=list)  # 服务标签
 
     # 认证配置
     requires_auth = Column(Boolean, default=True)
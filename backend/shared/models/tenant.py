@@ -1,7 +1,7 @@
 """
 租户模型
 """
-from sqlalchemy import Column, String, Boolean, DateTime, JSON
+from sqlalchemy import Column, String, Boolean, DateTime, Integer, JSON
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -20,6 +20,8 @@ class Tenant(Base):
 
     # 租户配置（JSON格式）
     config = Column(JSON, default=dict)
+    # 配置版本号，每次修改配置时加一，各服务据此校验本地缓存
+    config_version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # 租户可用的服务列表（服务ID列表）
     enabled_services = Column(JSON, default=list)
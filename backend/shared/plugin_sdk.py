@@ -0,0 +1,275 @@
+"""
+插件 SDK
+负责向注册中心注册、定期发送心跳、在注册中心丢失服务时重新注册，以及关闭时注销
+
+只依赖 httpx 和标准库，不导入 shared 中的配置和数据库模块，插件服务可以直接使用：
+
+    plugin = PluginClient(REGISTRY_URL, SERVICE_CONFIG)
+    app = FastAPI(lifespan=plugin.lifespan)
+
+    plugin.update_metadata(load=0.3)  # 随下一次心跳一起发送
+
+    tenant_configs = TenantConfigClient(CORE_URL)
+    config = await tenant_configs.for_request(request)  # 当前请求所属租户的配置
+"""
+import asyncio
+import random
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+
+class PluginClient:
+    """
+    插件与注册中心之间的客户端
+    整个进程共用一个连接池；心跳间隔带随机抖动，避免大量插件同时请求注册中心；
+    失败后按指数退避重试，注册中心恢复后回到正常间隔
+    """
+
+    def __init__(
+        self,
+        registry_url: str,
+        service_config: Dict[str, Any],
+        heartbeat_interval: float = 30.0,
+        jitter: float = 0.1,
+        retry_base: float = 1.0,
+        max_backoff: float = 300.0,
+        timeout: float = 5.0,
+    ):
+        self.registry_url = registry_url.rstrip("/")
+        self.service_config = service_config
+        self.heartbeat_interval = heartbeat_interval
+        self.jitter = jitter
+        self.retry_base = retry_base
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.service_id: Optional[str] = None
+        self._pending_metadata: Dict[str, Any] = {}
+        self._failures = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def name(self) -> str:
+        return self.service_config["name"]
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """共享的 HTTP 客户端，只需要少量长连接"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.registry_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=2, max_keepalive_connections=1),
+            )
+        return self._client
+
+    async def register(self) -> bool:
+        """注册服务，成功后记录注册中心分配的服务 ID"""
+        try:
+            response = await self.client.post("/api/registry/register", json=self.service_config)
+        except httpx.HTTPError as e:
+            print(f"✗ 连接注册中心失败: {e}")
+            return False
+
+        if response.status_code not in (200, 201):
+            print(f"✗ 服务注册失败: {response.status_code} - {response.text}")
+            return False
+
+        self.service_id = response.json()["id"]
+        # 注册请求已携带最新的元数据
+        self._pending_metadata.clear()
+        print(f"✓ 服务注册成功: {self.name} ({self.service_id})")
+        return True
+
+    def update_metadata(self, **metadata):
+        """
+        更新服务元数据
+        变更先在本地合并，随下一次心跳批量发送，不单独请求注册中心
+        """
+        self._pending_metadata.update(metadata)
+        self.service_config.setdefault("service_metadata", {}).update(metadata)
+
+    async def heartbeat(self) -> bool:
+        """发送一次心跳；尚未注册或注册中心返回 404 时重新注册"""
+        if self.service_id is None:
+            return await self.register()
+
+        metadata, self._pending_metadata = self._pending_metadata, {}
+        payload: Dict[str, Any] = {"service_id": self.service_id, "status": "healthy"}
+        if metadata:
+            payload["service_metadata"] = metadata
+
+        try:
+            response = await self.client.post("/api/registry/heartbeat", json=payload)
+        except httpx.HTTPError as e:
+            self._restore_metadata(metadata)
+            print(f"✗ 心跳发送失败: {e}")
+            return False
+
+        if response.status_code == 404:
+            # 注册中心已不认识该服务（例如被删除），重新注册
+            print(f"⚠ 注册中心未找到服务 {self.name}，重新注册")
+            self.service_id = None
+            return await self.register()
+
+        if response.status_code != 200:
+            self._restore_metadata(metadata)
+            print(f"✗ 心跳发送失败: {response.status_code}")
+            return False
+
+        return True
+
+    def _restore_metadata(self, metadata: Dict[str, Any]):
+        # 未送达的变更放回队列，期间的新变更优先
+        self._pending_metadata = {**metadata, **self._pending_metadata}
+
+    async def deregister(self):
+        """注销服务"""
+        if self.service_id is None:
+            return
+        try:
+            await self.client.post(f"/api/registry/deregister/{self.service_id}")
+            print(f"✓ 服务注销成功: {self.name}")
+        except httpx.HTTPError as e:
+            print(f"✗ 服务注销失败: {e}")
+
+    def next_delay(self, succeeded: bool) -> float:
+        """
+        下一次心跳前的等待秒数
+        成功时为心跳间隔加减抖动；失败时指数退避并使用全抖动
+        """
+        if succeeded:
+            self._failures = 0
+            spread = self.heartbeat_interval * self.jitter
+            return self.heartbeat_interval + random.uniform(-spread, spread)
+
+        self._failures += 1
+        backoff = min(self.retry_base * 2 ** (self._failures - 1), self.max_backoff)
+        return random.uniform(backoff / 2, backoff)
+
+    async def _run(self, registered: bool):
+        succeeded = registered
+        while True:
+            await asyncio.sleep(self.next_delay(succeeded))
+            succeeded = await self.heartbeat()
+
+    async def start(self):
+        """注册服务并启动后台心跳；注册失败不阻塞启动，由心跳循环重试"""
+        registered = await self.register()
+        self._task = asyncio.create_task(self._run(registered))
+
+    async def stop(self):
+        """停止心跳、注销服务并关闭连接"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.deregister()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @asynccontextmanager
+    async def lifespan(self, app):
+        """FastAPI lifespan：启动时注册，关闭时注销"""
+        await self.start()
+        try:
+            yield
+        finally:
+            await self.stop()
+
+
+class TenantConfigClient:
+    """
+    插件读取租户配置（core 的 GET /tenants/{tenant_id}/config）
+    配置按租户缓存，但只有 core 在 ttl 秒内确认过可以读取该租户配置的令牌才能命中缓存，
+    伪造的 X-Tenant-Id 或令牌总会被转发到 core 校验
+
+    网关转发请求时附带 X-Tenant-Config-Version，本地缓存版本不低于该版本时不需要重新加载配置
+    """
+
+    def __init__(self, core_url: str, ttl: float = 10.0, timeout: float = 5.0, maxsize: int = 10000):
+        self.core_url = core_url.rstrip("/")
+        self.ttl = ttl
+        self.timeout = timeout
+        self.maxsize = maxsize
+        # tenant_id -> (版本号, 配置)
+        self._entries: "OrderedDict[str, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+        # (tenant_id, Authorization) -> core 最近一次确认的时间
+        self._grants: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.core_url, timeout=self.timeout)
+        return self._client
+
+    def _remember(self, cache: OrderedDict, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.maxsize:
+            cache.popitem(last=False)
+
+    async def get(
+        self,
+        tenant_id: str,
+        authorization: str,
+        version: Optional[int] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """读取租户配置，authorization 为请求方的 Authorization 头；租户不存在或无权读取时返回 None"""
+        grant = (tenant_id, authorization)
+        entry = self._entries.get(tenant_id)
+        granted_at = self._grants.get(grant)
+        if (
+            entry is not None
+            and granted_at is not None
+            and time.monotonic() - granted_at < self.ttl
+            and (version is None or entry[0] >= version)
+        ):
+            return entry[1]
+
+        headers = {"authorization": authorization}
+        if entry is not None:
+            headers["if-none-match"] = f'"{entry[0]}"'
+        try:
+            response = await self.client.get(f"/tenants/{tenant_id}/config", headers=headers)
+        except httpx.HTTPError as e:
+            print(f"✗ 读取租户配置失败: {e}")
+            # core 不可用时，之前确认过的令牌继续使用旧配置
+            return entry[1] if entry is not None and granted_at is not None else None
+
+        if response.status_code == 304 and entry is not None:
+            self._remember(self._grants, grant, time.monotonic())
+            return entry[1]
+        if response.status_code == 200:
+            data = response.json()
+            self._remember(self._entries, tenant_id, (data["version"], data["config"]))
+            self._remember(self._grants, grant, time.monotonic())
+            return data["config"]
+        self._grants.pop(grant, None)
+        if response.status_code == 404:
+            self._entries.pop(tenant_id, None)
+        return None
+
+    async def for_request(self, request) -> Optional[Dict[str, Any]]:
+        """读取经网关转发的请求所属租户的配置，匿名请求返回 None"""
+        tenant_id = request.headers.get("x-tenant-id")
+        authorization = request.headers.get("authorization")
+        if not tenant_id or not authorization:
+            return None
+        version = request.headers.get("x-tenant-config-version")
+        return await self.get(tenant_id, authorization, int(version) if version and version.isdigit() else None)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
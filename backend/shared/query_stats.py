@@ -0,0 +1,172 @@
+"""
+SQL 统计模块
+记录每条语句的耗时、行数和所属路由，记录慢查询日志（参数脱敏、按比例附带执行计划），
+并在响应头 Server-Timing 中返回本次请求的数据库耗时和查询次数
+"""
+import logging
+import random
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from .config import get_settings
+from .metrics import histogram
+
+settings = get_settings()
+
+logger = logging.getLogger("shared.db.slow_query")
+
+db_request_duration = histogram(
+    "db_request_duration_seconds",
+    "Total database time spent per HTTP request",
+    ("route",),
+)
+db_request_queries = histogram(
+    "db_request_queries",
+    "Number of SQL statements executed per HTTP request",
+    ("route",),
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100),
+)
+
+
+class QueryStats:
+    """单个请求的数据库统计"""
+
+    __slots__ = ("scope", "count", "duration")
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.scope = scope
+        self.count = 0
+        self.duration = 0.0
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route") if self.scope else None
+        return getattr(route, "path", "-")
+
+
+_request_stats: ContextVar[Optional[QueryStats]] = ContextVar("request_query_stats", default=None)
+
+
+def current_query_stats() -> Optional[QueryStats]:
+    """当前请求的数据库统计"""
+    return _request_stats.get()
+
+
+def _redact(parameters):
+    """参数脱敏，只保留结构和类型"""
+    if isinstance(parameters, dict):
+        return {k: type(v).__name__ for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany
+            return [_redact(parameters[0]), f"... x{len(parameters)}"]
+        return [type(v).__name__ for v in parameters]
+    return parameters
+
+
+def _explain(conn, cursor, statement: str, parameters):
+    """
+    在同一连接上获取执行计划（直接使用 DBAPI 游标，避免触发事件钩子）
+    请求的事务中包在保存点里执行：PostgreSQL 上失败的 EXPLAIN 会中止整个事务，回滚到保存点后请求不受影响
+    """
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    savepoint = conn.in_transaction()
+    explain_cursor = cursor.connection.cursor()
+    try:
+        if savepoint:
+            explain_cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            explain_cursor.execute(prefix + statement, parameters)
+            return [" ".join(str(col) for col in row) for row in explain_cursor.fetchall()]
+        except Exception:
+            if savepoint:
+                explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            raise
+        finally:
+            if savepoint:
+                explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+    except Exception as e:
+        return [f"EXPLAIN failed: {e}"]
+    finally:
+        explain_cursor.close()
+
+
+def instrument_queries(engine):
+    """为引擎注册语句计时钩子"""
+    from sqlalchemy import event
+
+    slow_threshold = settings.DB_SLOW_QUERY_MS / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context._query_started
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.duration += duration
+
+        if duration < slow_threshold:
+            return
+
+        route = stats.route if stats is not None else "-"
+        plan = None
+        if (
+            not executemany
+            and statement.lstrip()[:6].upper() == "SELECT"
+            and random.random() < settings.DB_SLOW_QUERY_EXPLAIN_RATE
+        ):
+            plan = _explain(conn, cursor, statement, parameters)
+
+        logger.warning(
+            "slow query %.1fms rows=%s route=%s: %s params=%s%s",
+            duration * 1000,
+            cursor.rowcount,
+            route,
+            " ".join(statement.split()),
+            _redact(parameters),
+            "\n  plan: " + "\n  plan: ".join(plan) if plan else "",
+        )
+
+
+class QueryStatsMiddleware:
+    """统计每个请求的数据库耗时，并写入 Server-Timing 响应头"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(scope)
+        token = _request_stats.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((
+                    b"server-timing",
+                    f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"'.encode(),
+                ))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            if stats.count:
+                route = stats.route
+                db_request_duration.labels(route).observe(stats.duration)
+                db_request_queries.labels(route).observe(stats.count)
+
+
+def instrument_query_stats(app):
+    """为应用安装请求级数据库统计中间件"""
+    app.add_middleware(QueryStatsMiddleware)
@@ -39,6 +39,11 @@ class Token(BaseModel):
     token_type: str = "bearer"
 
 
+class RefreshRequest(BaseModel):
+    """刷新令牌请求Schema"""
+    refresh_token: str
+
+
 class TokenData(BaseModel):
     """Token数据Schema"""
     user_id: Optional[str] = None
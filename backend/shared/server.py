@@ -0,0 +1,125 @@
+"""
+服务启动模块
+生产模式：gunicorn 主进程导入应用后预派生多个 uvicorn worker，
+worker 数、事件循环（uvloop）和 HTTP 解析器（httptools）取自配置，收到 SIGTERM 时等待进行中的请求完成
+开发模式（--reload）：单进程 uvicorn，监听文件变化自动重启
+"""
+import argparse
+import os
+import sys
+from typing import Callable, Optional
+
+from .config import Settings, get_settings
+
+
+def _parse_args(port: int):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=port)
+    parser.add_argument("--workers", type=int, default=None, help="worker 进程数，默认取 WEB_CONCURRENCY")
+    parser.add_argument("--reload", action="store_true", help="开发模式：单进程并自动重载")
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args()
+
+
+def run_service(app_path: str, port: int, preflight: Optional[Callable[[Settings], int]] = None):
+    """
+    按命令行参数和配置启动服务，app_path 形如 core.main:app
+    preflight 在派生 worker 之前以配置调用并返回实际使用的 worker 数，
+    用于依赖进程间共享状态的服务限制 worker 数或拒绝启动
+    """
+    args = _parse_args(port)
+
+    if args.reload:
+        import uvicorn
+
+        uvicorn.run(app_path, host=args.host, port=args.port, reload=True, log_level=args.log_level)
+        return
+
+    if args.workers:
+        # 写回环境变量，使各 worker 中按 worker 数计算的配置（如连接池预算）保持一致
+        os.environ["WEB_CONCURRENCY"] = str(args.workers)
+        get_settings.cache_clear()
+    settings = get_settings()
+    if preflight is not None:
+        workers = preflight(settings)
+        if workers != settings.worker_count:
+            os.environ["WEB_CONCURRENCY"] = str(workers)
+            get_settings.cache_clear()
+            settings = get_settings()
+
+    if BaseApplication is None:
+        # gunicorn 不支持 Windows，退回 uvicorn 自带的多进程模式
+        import uvicorn
+
+        uvicorn.run(
+            app_path,
+            host=args.host,
+            port=args.port,
+            workers=settings.worker_count,
+            loop=settings.SERVER_LOOP,
+            http=settings.SERVER_HTTP,
+            timeout_keep_alive=settings.SERVER_KEEPALIVE,
+            timeout_graceful_shutdown=settings.SERVER_GRACEFUL_TIMEOUT,
+            log_level=args.log_level,
+        )
+        return
+
+    _ServiceApplication(app_path, {
+        "bind": f"{args.host}:{args.port}",
+        "workers": settings.worker_count,
+        "worker_class": ServiceWorker,
+        "preload_app": True,
+        "post_fork": _post_fork,
+        "keepalive": settings.SERVER_KEEPALIVE,
+        "graceful_timeout": settings.SERVER_GRACEFUL_TIMEOUT,
+        "loglevel": args.log_level,
+        "accesslog": "-",
+    }).run()
+
+
+def _post_fork(server, worker):
+    """
+    worker 派生后丢弃从主进程继承的数据库连接
+    主进程导入应用时可能已建立连接，多个进程共用同一个套接字会导致协议错乱
+    """
+    database = sys.modules.get("shared.database")
+    if database is None:
+        return
+    database.engine.dispose(close=False)
+    for replica in database.replica_engines:
+        replica.dispose(close=False)
+
+
+try:
+    from gunicorn.app.base import BaseApplication
+    from uvicorn.workers import UvicornWorker
+except ImportError:
+    BaseApplication = None
+else:
+
+    class ServiceWorker(UvicornWorker):
+        """按配置选择事件循环和 HTTP 解析器的 uvicorn worker"""
+
+        CONFIG_KWARGS = {
+            "loop": get_settings().SERVER_LOOP,
+            "http": get_settings().SERVER_HTTP,
+            "timeout_graceful_shutdown": get_settings().SERVER_GRACEFUL_TIMEOUT,
+        }
+
+    class _ServiceApplication(BaseApplication):
+        """以代码方式配置的 gunicorn 应用"""
+
+        def __init__(self, app_path: str, options: dict):
+            self.app_path = app_path
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from uvicorn.importer import import_from_string
+
+            return import_from_string(self.app_path)
@@ -0,0 +1,114 @@
+"""
+租户配置缓存
+按租户缓存 (版本号, 配置)，热路径上直接读本地字典；条目超过 TTL 后通过 fetch 校验版本，
+版本未变时只刷新校验时间，因此任意时刻读到的配置最多落后 TTL 秒
+
+core 的 fetch 查询数据库，网关的 fetch 向 core 发起条件请求（If-None-Match），
+插件通过网关转发的 X-Tenant-Config-Version 头判断缓存是否过期（见 plugin_sdk.TenantConfigClient）
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# 网关转发给上游的请求头
+TENANT_ID_HEADER = "x-tenant-id"
+TENANT_CONFIG_VERSION_HEADER = "x-tenant-config-version"
+
+
+@dataclass
+class TenantConfig:
+    tenant_id: str
+    version: int
+    config: Dict[str, Any]
+    checked_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.version}"'
+
+    def to_dict(self) -> dict:
+        return {"tenant_id": self.tenant_id, "version": self.version, "config": self.config}
+
+
+# fetch(tenant_id, cached, *args) 返回最新配置；版本未变时可直接返回 cached，租户不存在时返回 None
+Fetch = Callable[..., Awaitable[Optional[TenantConfig]]]
+
+
+def parse_etag(value: Optional[str]) -> Optional[int]:
+    """解析 ETag / If-None-Match / If-Match 中的版本号"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        return None
+
+
+class TenantConfigCache:
+    """进程内的租户配置缓存，同一租户同时只有一个校验请求"""
+
+    def __init__(self, fetch: Fetch, ttl: float, maxsize: int = 10000):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, TenantConfig]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def peek(self, tenant_id: str) -> Optional[TenantConfig]:
+        """只读本地缓存，不校验"""
+        return self._entries.get(tenant_id)
+
+    async def get(self, tenant_id: str, *args) -> Optional[TenantConfig]:
+        """读取租户配置，缓存未过期时不做任何 I/O；args 原样传给 fetch"""
+        entry = self._entries.get(tenant_id)
+        if entry is not None and time.monotonic() - entry.checked_at < self.ttl:
+            self._entries.move_to_end(tenant_id)
+            return entry
+
+        pending = self._inflight.get(tenant_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[tenant_id] = future
+        try:
+            fresh = await self.fetch(tenant_id, entry, *args)
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            if fresh is None:
+                self.invalidate(tenant_id)
+            else:
+                fresh.checked_at = time.monotonic()
+                self.put(fresh)
+            future.set_result(fresh)
+            return fresh
+        finally:
+            del self._inflight[tenant_id]
+
+    def put(self, entry: TenantConfig):
+        """写入缓存，不会用旧版本覆盖新版本"""
+        current = self._entries.get(entry.tenant_id)
+        if current is not None and current.version > entry.version:
+            return
+        self._entries[entry.tenant_id] = entry
+        self._entries.move_to_end(entry.tenant_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def observe(self, tenant_id: str, version: int):
+        """得知某租户的最新版本号，本地版本较旧时下次读取立即校验"""
+        entry = self._entries.get(tenant_id)
+        if entry is not None and entry.version < version:
+            entry.checked_at = float("-inf")
+
+    def invalidate(self, tenant_id: str):
+        self._entries.pop(tenant_id, None)
@@ -0,0 +1,469 @@
+"""
+分布式追踪模块
+W3C traceparent 传播、头部采样 + 慢请求/失败请求的尾部补采，以及 OTLP JSON 文件导出
+
+未被头部采样的请求只记录根 span 的起止时间，子 span 均为无操作的空 span，开销仅为一次 ContextVar 读取；
+请求结束时慢或失败则补采，导出只含根 span 的 trace
+"""
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from .config import get_settings
+
+settings = get_settings()
+
+# OTLP span kind
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+# 单个 trace 最多保留的 span 数，防止长请求无限增长
+MAX_SPANS_PER_TRACE = 1000
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class _Trace:
+    """一次请求内收集的所有 span"""
+
+    __slots__ = ("trace_id", "head_sampled", "spans", "error")
+
+    def __init__(self, trace_id: str, head_sampled: bool):
+        self.trace_id = trace_id
+        self.head_sampled = head_sampled
+        self.spans: List["Span"] = []
+        self.error = False
+
+
+class Span:
+    """追踪 span，可作为上下文管理器使用"""
+
+    __slots__ = (
+        "trace", "span_id", "parent_id", "name", "kind",
+        "start_ns", "end_ns", "attributes", "events", "status_message", "_token",
+    )
+
+    def __init__(self, trace: _Trace, name: str, parent_id: Optional[str], kind: int):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: Dict[str, Any] = {}
+        self.events: List[tuple] = []
+        self.status_message: Optional[str] = None
+        self._token = None
+
+    @property
+    def recording(self) -> bool:
+        return True
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str):
+        self.events.append((time.time_ns(), name))
+
+    def set_error(self, message: str):
+        self.status_message = message
+        self.trace.error = True
+
+    def traceparent(self) -> str:
+        flags = "01" if self.trace.head_sampled else "00"
+        return f"00-{self.trace.trace_id}-{self.span_id}-{flags}"
+
+    def end(self):
+        if not self.end_ns:
+            self.end_ns = time.time_ns()
+            if len(self.trace.spans) < MAX_SPANS_PER_TRACE:
+                self.trace.spans.append(self)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and self.status_message is None:
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        self.end()
+        _current_span.reset(self._token)
+        return False
+
+
+class _NoopSpan:
+    """未记录时使用的空 span"""
+
+    __slots__ = ()
+
+    recording = False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name):
+        pass
+
+    def set_error(self, message):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _TailRoot:
+    """未被头部采样的根 span：只计时，不生成 ID、不进入上下文，慢或失败时再转为完整的 span"""
+
+    __slots__ = ("name", "kind", "trace_id", "parent_id", "start_ns", "end_ns", "attributes", "status_message")
+
+    recording = False
+
+    def __init__(self, name: str, trace_id: Optional[str], parent_id: Optional[str], kind: int):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: Dict[str, Any] = {}
+        self.status_message: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str):
+        pass
+
+    def set_error(self, message: str):
+        self.status_message = message
+
+    def end(self):
+        if not self.end_ns:
+            self.end_ns = time.time_ns()
+
+    def promote(self) -> Span:
+        trace = _Trace(self.trace_id or os.urandom(16).hex(), False)
+        span = Span(trace, self.name, self.parent_id, self.kind)
+        span.start_ns, span.end_ns = self.start_ns, self.end_ns
+        span.attributes = self.attributes
+        span.status_message = self.status_message
+        trace.error = self.status_message is not None
+        trace.spans.append(span)
+        return span
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and self.status_message is None:
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        self.end()
+        return False
+
+
+def current_span():
+    """当前 span，没有时返回空 span"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, parent: Optional[Span] = None):
+    """在当前 span 下创建子 span"""
+    parent = parent or _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.trace, name, parent.span_id, kind)
+
+
+def traceparent() -> Optional[str]:
+    """当前 span 的 traceparent 头，用于向上游传播"""
+    span = _current_span.get()
+    return span.traceparent() if span is not None else None
+
+
+def unsampled_traceparent(header: str) -> Optional[str]:
+    """清除采样标志的 traceparent，格式无效时返回 None"""
+    parsed = _parse_traceparent(header)
+    return f"00-{parsed[0]}-{parsed[1]}-00" if parsed else None
+
+
+def _parse_traceparent(header: str):
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def start_trace(name: str, header: Optional[str] = None, kind: int = SPAN_KIND_SERVER, trust_sampled: bool = True):
+    """
+    开始一次请求的根 span
+    沿用上游的采样决定（trust_sampled 为 False 时只沿用 trace ID，自行按采样率决定）；
+    没有 traceparent 时按采样率做头部采样。未被头部采样时开启尾部补采则只计时，否则返回空 span
+    """
+    parsed = _parse_traceparent(header) if header else None
+    if parsed:
+        trace_id, parent_id, head_sampled = parsed
+    else:
+        trace_id, parent_id, head_sampled = None, None, False
+    if not parsed or not trust_sampled:
+        head_sampled = random.random() < settings.TRACING_SAMPLE_RATE
+
+    if not head_sampled:
+        if settings.TRACING_TAIL_SAMPLING:
+            return _TailRoot(name, trace_id, parent_id, kind)
+        return NOOP_SPAN
+
+    trace = _Trace(trace_id or os.urandom(16).hex(), head_sampled)
+    return Span(trace, name, parent_id, kind)
+
+
+def finish_trace(root):
+    """结束根 span，按采样决定导出"""
+    if isinstance(root, _TailRoot):
+        duration_ms = (root.end_ns - root.start_ns) / 1e6
+        if root.status_message is not None or duration_ms >= settings.TRACING_SLOW_THRESHOLD_MS:
+            _exporter.export(root.promote().trace)
+        return
+    if not root.recording:
+        return
+    trace = root.trace
+    duration_ms = (root.end_ns - root.start_ns) / 1e6
+    if trace.head_sampled or trace.error or duration_ms >= settings.TRACING_SLOW_THRESHOLD_MS:
+        _exporter.export(trace)
+
+
+# ==================== 导出 ====================
+
+
+def _attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _span_to_otlp(span: Span) -> dict:
+    data = {
+        "traceId": span.trace.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [_attribute(k, v) for k, v in span.attributes.items()],
+        "events": [{"timeUnixNano": str(t), "name": n} for t, n in span.events],
+        "status": {"code": 2, "message": span.status_message} if span.status_message else {"code": 0},
+    }
+    if span.parent_id:
+        data["parentSpanId"] = span.parent_id
+    return data
+
+
+class FileSpanExporter:
+    """
+    以 OTLP JSON 格式（每行一个 resourceSpans 批次）写入本地文件
+    写文件在后台线程进行，不阻塞事件循环
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.service_name = "unknown"
+        self._queue: "queue.SimpleQueue[Optional[_Trace]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, trace: _Trace):
+        if self._thread is None:
+            self._start()
+        self._queue.put(trace)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def _run(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                trace = self._queue.get()
+                if trace is None:
+                    return
+                batch = [trace]
+                # 合并已排队的 trace，减少写入次数
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        self._write(f, batch)
+                        return
+                    batch.append(item)
+                self._write(f, batch)
+
+    def _write(self, f, batch: List[_Trace]):
+        line = json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "shared.tracing"},
+                    "spans": [_span_to_otlp(s) for trace in batch for s in trace.spans],
+                }],
+            }],
+        }, ensure_ascii=False)
+        f.write(line + "\n")
+        f.flush()
+
+    def shutdown(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+    def _after_fork(self):
+        # 线程不会被 fork 继承，子进程中首次导出时重新启动写入线程
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+
+_exporter = FileSpanExporter(settings.TRACING_EXPORT_PATH)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_exporter._after_fork)
+
+
+# ==================== 框架集成 ====================
+
+
+class TracingMiddleware:
+    """为每个 HTTP 请求创建根 span 的 ASGI 中间件"""
+
+    def __init__(self, app, trusted_clients: Optional[set] = None):
+        """trusted_clients 为 None 时信任所有调用方的采样标志，否则只信任其中的客户端地址"""
+        self.app = app
+        self.trusted_clients = trusted_clients
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                header = value.decode("latin-1")
+                break
+
+        trusted = True
+        if header is not None and self.trusted_clients is not None:
+            client = scope.get("client")
+            trusted = client is not None and client[0] in self.trusted_clients
+        root = start_trace(scope["method"], header, trust_sampled=trusted)
+        if root is NOOP_SPAN:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.set_error(f"HTTP {message['status']}")
+            await send(message)
+
+        try:
+            with root:
+                try:
+                    await self.app(scope, receive, send_wrapper)
+                finally:
+                    route = scope.get("route")
+                    route_path = getattr(route, "path", scope["path"])
+                    root.name = f"{scope['method']} {route_path}"
+                    root.set_attribute("http.method", scope["method"])
+                    root.set_attribute("http.route", route_path)
+        finally:
+            finish_trace(root)
+
+
+def instrument_tracing(app, service_name: str, edge: bool = False):
+    """
+    为应用安装追踪中间件
+    edge 为 True（网关）时只信任 TRACING_TRUSTED_CLIENTS 中的客户端发来的采样标志，
+    避免外部请求通过 traceparent 强制采样
+    """
+    if not settings.TRACING_ENABLED:
+        return
+    _exporter.service_name = service_name
+    trusted = set(settings.tracing_trusted_clients_list) if edge else None
+    app.add_middleware(TracingMiddleware, trusted_clients=trusted)
+
+
+def httpx_trace_hook(span: Span):
+    """httpx 的 trace 扩展回调，将连接与收发阶段记录为 span 事件"""
+
+    async def trace(event_name: str, info: dict):
+        if event_name.endswith((".started", ".complete")):
+            span.add_event(event_name)
+
+    return trace
+
+
+def instrument_engine(engine):
+    """为 SQLAlchemy 引擎的每条语句创建子 span"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        parent = _current_span.get()
+        if parent is None:
+            return
+        span = Span(parent.trace, "db.query", parent.span_id, SPAN_KIND_CLIENT)
+        span.set_attribute("db.system", conn.dialect.name)
+        span.set_attribute("db.statement", statement)
+        context._trace_span = span
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            span.end()
+            context._trace_span = None
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        context = exception_context.execution_context
+        span = getattr(context, "_trace_span", None) if context is not None else None
+        if span is not None:
+            span.set_error(str(exception_context.original_exception))
+            span.end()
+            context._trace_span = None
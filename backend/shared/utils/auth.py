@@ -1,28 +1,159 @@
 """
 认证工具函数
 """
+import asyncio
+import importlib.util
+import time
+import uuid
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from fastapi import HTTPException, status
 from ..config import get_settings
+from ..metrics import histogram
+from .tokens import TokenError, get_token_codec
 
 settings = get_settings()
 
-# 密码加密上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# passlib/bcrypt 导入耗时较长，首次使用时才加载，只校验令牌或不做认证的服务不承担这部分启动时间和内存
+
+PASSWORD_HASH_SCHEMES = ("bcrypt", "argon2")
+
+
+def _argon2_available() -> bool:
+    return importlib.util.find_spec("argon2") is not None
+
+
+@lru_cache()
+def _pwd_context():
+    """
+    密码加密上下文
+    PASSWORD_HASH_SCHEME 为新哈希使用的算法，其余可用算法仅用于校验已有哈希；
+    算法或参数与配置不一致的哈希在登录成功时重新计算（needs_update）
+    """
+    from passlib.context import CryptContext
+
+    scheme = settings.PASSWORD_HASH_SCHEME
+    if scheme not in PASSWORD_HASH_SCHEMES:
+        raise ValueError(f"不支持的密码哈希算法: {scheme}")
+    if scheme == "argon2" and not _argon2_available():
+        raise RuntimeError("PASSWORD_HASH_SCHEME=argon2 需要安装 argon2-cffi")
+
+    schemes = [scheme]
+    if scheme != "argon2" and _argon2_available():
+        # 从 argon2 切换回 bcrypt 时仍可校验旧哈希
+        schemes.append("argon2")
+    if scheme != "bcrypt":
+        schemes.append("bcrypt")
+
+    # min / max 与默认值相同：参数调高或调低都会触发重新哈希
+    rounds = settings.BCRYPT_ROUNDS
+    time_cost = settings.ARGON2_TIME_COST
+    return CryptContext(
+        schemes=schemes,
+        default=scheme,
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+        argon2__type="ID",
+        argon2__default_rounds=time_cost,
+        argon2__min_rounds=time_cost,
+        argon2__max_rounds=time_cost,
+        argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+        argon2__parallelism=settings.ARGON2_PARALLELISM,
+    )
+
+
+def load_auth_backends():
+    """
+    预先加载密码哈希依赖并准备 JWT 密钥
+    签发令牌、校验密码的服务在模块导入时调用，多 worker 模式下在 fork 前加载，各 worker 共享
+    """
+    _pwd_context()
+    get_token_codec()
+
+
+password_hash_duration = histogram(
+    "password_hash_duration_seconds",
+    "Time spent hashing or verifying passwords",
+    ("operation",),
+)
+_hash_timer = password_hash_duration.labels("hash")
+_verify_timer = password_hash_duration.labels("verify")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
+    return verify_and_update_password(plain_password, hashed_password)[0]
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """验证密码，返回 (是否匹配, 新哈希)；哈希算法或参数已过时时新哈希不为 None，调用方应保存"""
+    started = time.perf_counter()
     # Bcrypt限制密码长度为72字节
-    return pwd_context.verify(plain_password[:72], hashed_password)
+    result = _pwd_context().verify_and_update(plain_password[:72], hashed_password)
+    _verify_timer.observe(time.perf_counter() - started)
+    return result
 
 
 def get_password_hash(password: str) -> str:
     """生成密码哈希"""
+    started = time.perf_counter()
     # Bcrypt限制密码长度为72字节
-    return pwd_context.hash(password[:72])
+    hashed = _pwd_context().hash(password[:72])
+    _hash_timer.observe(time.perf_counter() - started)
+    return hashed
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    """批量生成密码哈希，供批量导入在进程池中调用"""
+    return [get_password_hash(password) for password in passwords]
+
+
+class _HashLimiter:
+    """
+    限制每个 worker 同时进行的密码哈希数量，超出的请求排队，队列满时快速返回 503
+    哈希在线程池中计算（bcrypt 和 argon2 计算时释放 GIL），不阻塞事件循环；
+    登录占用的 CPU 上限约为 worker 数 × PASSWORD_HASH_CONCURRENCY 个核
+    """
+
+    def __init__(self):
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+
+    async def run(self, fn, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.PASSWORD_HASH_CONCURRENCY)
+        if self._semaphore.locked() and self.waiting >= settings.PASSWORD_HASH_QUEUE_LIMIT:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent logins, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            return await asyncio.to_thread(fn, *args)
+        finally:
+            self._semaphore.release()
+
+
+_hash_limiter = _HashLimiter()
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """在线程池中验证密码，受并发上限约束"""
+    return await _hash_limiter.run(verify_and_update_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """在线程池中生成密码哈希，受并发上限约束"""
+    return await _hash_limiter.run(get_password_hash, password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -34,23 +165,35 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
 
     to_encode.update({"exp": expire, "type": "access"})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-    return encoded_jwt
+    return get_token_codec().encode(to_encode)
 
 
-def create_refresh_token(data: dict) -> str:
-    """创建刷新令牌"""
+def create_refresh_token(data: dict, family: Optional[str] = None, family_expires: Optional[int] = None) -> str:
+    """
+    创建刷新令牌
+    jti 标识单个令牌（使用一次后吊销），fam 标识同一次登录轮换出的令牌族（发现重放时整族吊销）；
+    fam_exp 为令牌族的绝对过期时间，登录时确定，轮换不会延长
+    """
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire, "type": "refresh"})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-    return encoded_jwt
+    if family_expires is None:
+        family_expires = int(time.time() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS).total_seconds())
+    expire = min(
+        datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+        datetime.utcfromtimestamp(family_expires),
+    )
+    to_encode.update({
+        "exp": expire,
+        "type": "refresh",
+        "jti": uuid.uuid4().hex,
+        "fam": family or uuid.uuid4().hex,
+        "fam_exp": family_expires,
+    })
+    return get_token_codec().encode(to_encode)
 
 
 def decode_token(token: str) -> Optional[dict]:
     """解码令牌"""
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload
-    except JWTError:
+        return get_token_codec().decode(token)
+    except TokenError:
         return None
@@ -0,0 +1,192 @@
+"""
+令牌吊销列表
+已使用的刷新令牌（jti）和被吊销的令牌族记录到令牌过期为止，过期后自动清除，列表大小只取决于有效期内的吊销数量
+
+本地结构：Bloom filter 在前，绝大多数未吊销的令牌只需几次位运算即可排除；命中时再查精确集合，
+精确集合以 16 字节摘要为键，不会误判
+
+启用 TOKEN_REVOCATION_REDIS 时以 Redis 为准：吊销使用 SET NX（同一刷新令牌在多个 worker 中也只能成功使用一次），
+并通过发布订阅同步到各 worker 的本地结构；Redis 不可用时退回进程内列表
+"""
+import asyncio
+import hashlib
+import math
+import time
+from typing import Dict, Optional
+
+from ..config import Settings, get_settings
+
+settings = get_settings()
+
+_REDIS_PREFIX = "revoked:"
+_REDIS_CHANNEL = "revocations"
+
+
+def _digest(token_id: str) -> bytes:
+    return hashlib.blake2b(token_id.encode(), digest_size=16).digest()
+
+
+class BloomFilter:
+    """定长位数组的 Bloom filter，按容量和误判率计算位数和哈希次数"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest: bytes):
+        # 双重哈希：由摘要的两半生成 k 个位置
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, digest: bytes):
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(digest))
+
+
+class RevocationList:
+    """进程内吊销列表：Bloom filter + 精确集合 {摘要: 过期时间}"""
+
+    def __init__(self, capacity: int, purge_interval: float = 60.0):
+        self.capacity = capacity
+        self.purge_interval = purge_interval
+        self.entries: Dict[bytes, float] = {}
+        self.bloom = BloomFilter(capacity)
+        self._next_purge = time.time() + purge_interval
+
+    def add(self, token_id: str, expires_at: float) -> bool:
+        """记录吊销，已存在时返回 False"""
+        now = time.time()
+        if now >= self._next_purge or len(self.entries) >= self.capacity:
+            self.purge(now)
+        digest = _digest(token_id)
+        current = self.entries.get(digest)
+        if current is not None and current > now:
+            return False
+        self.entries[digest] = expires_at
+        self.bloom.add(digest)
+        return True
+
+    def __contains__(self, token_id: str) -> bool:
+        digest = _digest(token_id)
+        if digest not in self.bloom:
+            return False
+        expires_at = self.entries.get(digest)
+        return expires_at is not None and expires_at > time.time()
+
+    def purge(self, now: Optional[float] = None):
+        """清除已过期的条目，并用剩余条目重建 Bloom filter（Bloom filter 不支持删除）"""
+        now = now or time.time()
+        self.entries = {d: exp for d, exp in self.entries.items() if exp > now}
+        # 活跃条目超过预期容量时扩容，保持误判率
+        while len(self.entries) >= self.capacity * 0.75:
+            self.capacity *= 2
+        self.bloom = BloomFilter(self.capacity)
+        for digest in self.entries:
+            self.bloom.add(digest)
+        self._next_purge = now + self.purge_interval
+
+
+class RevocationStore:
+    """吊销列表，可选通过 Redis 在多个 worker / 实例间共享"""
+
+    def __init__(self):
+        self.local = RevocationList(settings.TOKEN_REVOCATION_CAPACITY)
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def is_revoked(self, token_id: Optional[str]) -> bool:
+        """只查本地结构，Redis 中的吊销通过发布订阅同步"""
+        return bool(token_id) and token_id in self.local
+
+    async def revoke(self, token_id: str, expires_at: float) -> bool:
+        """
+        吊销令牌直到 expires_at，首次吊销返回 True，已吊销返回 False
+        刷新令牌轮换时用返回值保证每个刷新令牌只能使用一次
+        """
+        if self._redis is None:
+            return self.local.add(token_id, expires_at)
+
+        ttl = max(1, math.ceil(expires_at - time.time()))
+        try:
+            created = await self._redis.set(_REDIS_PREFIX + token_id, "1", ex=ttl, nx=True)
+            if created:
+                await self._redis.publish(_REDIS_CHANNEL, f"{token_id} {expires_at}")
+        except Exception as e:
+            print(f"✗ Redis 吊销写入失败，使用本地列表: {e}")
+            return self.local.add(token_id, expires_at)
+        self.local.add(token_id, expires_at)
+        return bool(created)
+
+    async def start(self):
+        if not settings.TOKEN_REVOCATION_REDIS:
+            return
+        try:
+            import redis.asyncio as redis
+
+            self._redis = redis.from_url(settings.REDIS_URL, decode_responses=True)
+            pubsub = self._redis.pubsub()
+            await pubsub.subscribe(_REDIS_CHANNEL)
+            # 先订阅再加载已有的吊销记录，避免两者之间的吊销丢失
+            await self._load()
+        except Exception as e:
+            print(f"⚠ 无法连接 Redis，吊销列表仅在本进程内生效: {e}")
+            self._redis = None
+            return
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def _load(self):
+        now = time.time()
+        async for key in self._redis.scan_iter(match=_REDIS_PREFIX + "*", count=1000):
+            ttl = await self._redis.pttl(key)
+            if ttl > 0:
+                self.local.add(key[len(_REDIS_PREFIX):], now + ttl / 1000)
+
+    async def _listen(self, pubsub):
+        try:
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                token_id, _, expires_at = message["data"].rpartition(" ")
+                self.local.add(token_id, float(expires_at))
+        except Exception as e:
+            print(f"✗ 吊销订阅中断: {e}")
+        finally:
+            await pubsub.aclose()
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+
+revocation_store = RevocationStore()
+
+
+def check_workers(config: Settings) -> int:
+    """
+    启动前检查：未启用 Redis 时吊销列表只在各 worker 进程内生效，
+    注销、刷新令牌的一次性使用和重放检测在其他 worker 中都不成立，
+    因此未配置 worker 数时只启动一个 worker，显式要求多个 worker 时拒绝启动
+    """
+    if config.TOKEN_REVOCATION_REDIS or config.worker_count <= 1:
+        return config.worker_count
+    if config.WEB_CONCURRENCY == 0:
+        print("⚠ 未启用 TOKEN_REVOCATION_REDIS，吊销列表只在进程内生效，以单个 worker 启动")
+        return 1
+    raise SystemExit(
+        f"✗ 以 {config.worker_count} 个 worker 启动需要共享的吊销列表，"
+        "请设置 TOKEN_REVOCATION_REDIS=true（需要 Redis），或使用 --workers 1"
+    )
@@ -0,0 +1,341 @@
+"""
+JWT 编解码
+密钥在进程内只准备一次：HMAC 预先计算密钥状态，非对称算法预先加载 PEM 密钥；
+每个密钥的 JWS 头部预先编码，校验时头部与已知头部完全相同则跳过头部解析
+
+支持 HS256 / HS384 / HS512（仅标准库）以及 EdDSA（Ed25519）、ES256（需要 cryptography）
+非对称算法下只有签发令牌的服务（core）需要私钥，网关等只校验令牌的服务配置公钥即可
+
+密钥轮换：新密钥使用新的 JWT_KEY_ID，旧密钥放入 JWT_ROTATED_KEYS，校验时按令牌头部的 kid 选择密钥；
+没有 kid 的令牌（配置 kid 之前签发）使用当前密钥校验
+"""
+import base64
+import binascii
+import calendar
+import hashlib
+import hmac
+import json
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+
+from ..config import get_settings
+
+settings = get_settings()
+
+HMAC_ALGORITHMS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+ASYMMETRIC_ALGORITHMS = ("EdDSA", "ES256")
+
+# 与 python-jose 一致，时间类声明中的 datetime 转为 Unix 时间戳
+_TIME_CLAIMS = ("exp", "iat", "nbf")
+
+
+class TokenError(Exception):
+    """令牌无效、过期或无法签发"""
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    try:
+        return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+    except (binascii.Error, ValueError) as e:
+        raise TokenError("Invalid base64 segment") from e
+
+
+def _encode_header(alg: str, kid: Optional[str]) -> bytes:
+    header = {"alg": alg, "typ": "JWT"}
+    if kid:
+        header["kid"] = kid
+    return _b64encode(json.dumps(header, separators=(",", ":"), sort_keys=True).encode())
+
+
+class TokenKey:
+    """准备好的签名 / 校验密钥"""
+
+    __slots__ = ("alg", "kid", "header", "sign", "verify")
+
+    def __init__(
+        self,
+        alg: str,
+        kid: Optional[str],
+        verify: Callable[[bytes, bytes], bool],
+        sign: Optional[Callable[[bytes], bytes]] = None,
+    ):
+        self.alg = alg
+        self.kid = kid or None
+        self.header = _encode_header(alg, self.kid)
+        self.verify = verify
+        self.sign = sign
+
+
+def hmac_key(alg: str, secret: str, kid: Optional[str] = None) -> TokenKey:
+    # 预先计算带密钥的 HMAC 状态，每次签名只复制状态，不再重复处理密钥
+    template = hmac.new(secret.encode(), digestmod=HMAC_ALGORITHMS[alg])
+
+    def sign(message: bytes) -> bytes:
+        mac = template.copy()
+        mac.update(message)
+        return mac.digest()
+
+    def verify(message: bytes, signature: bytes) -> bool:
+        return hmac.compare_digest(sign(message), signature)
+
+    return TokenKey(alg, kid, verify, sign)
+
+
+def asymmetric_key(alg: str, private_pem: Optional[bytes], public_pem: Optional[bytes], kid: Optional[str] = None) -> TokenKey:
+    """EdDSA / ES256 密钥，只提供公钥时只能校验"""
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+    from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature, encode_dss_signature
+
+    private = serialization.load_pem_private_key(private_pem, password=None) if private_pem else None
+    if public_pem:
+        public = serialization.load_pem_public_key(public_pem)
+    elif private is not None:
+        public = private.public_key()
+    else:
+        raise ValueError(f"{alg} 需要配置私钥或公钥")
+
+    if alg == "EdDSA":
+        if not isinstance(public, ed25519.Ed25519PublicKey):
+            raise ValueError("EdDSA 需要 Ed25519 密钥")
+
+        def verify(message: bytes, signature: bytes) -> bool:
+            try:
+                public.verify(signature, message)
+            except InvalidSignature:
+                return False
+            return True
+
+        return TokenKey(alg, kid, verify, private.sign if private is not None else None)
+
+    if not isinstance(public, ec.EllipticCurvePublicKey) or public.curve.name != "secp256r1":
+        raise ValueError("ES256 需要 P-256 密钥")
+    algorithm = ec.ECDSA(hashes.SHA256())
+
+    # JWS 中 ECDSA 签名为定长的 r || s，cryptography 使用 DER 编码
+    def verify(message: bytes, signature: bytes) -> bool:
+        if len(signature) != 64:
+            return False
+        r, s = int.from_bytes(signature[:32], "big"), int.from_bytes(signature[32:], "big")
+        try:
+            public.verify(encode_dss_signature(r, s), message, algorithm)
+        except InvalidSignature:
+            return False
+        return True
+
+    def sign(message: bytes) -> bytes:
+        r, s = decode_dss_signature(private.sign(message, algorithm))
+        return r.to_bytes(32, "big") + s.to_bytes(32, "big")
+
+    return TokenKey(alg, kid, verify, sign if private is not None else None)
+
+
+class TokenCodec(ABC):
+    """令牌编解码接口"""
+
+    @abstractmethod
+    def encode(self, claims: dict) -> str:
+        """签发令牌"""
+
+    @abstractmethod
+    def decode(self, token: str) -> dict:
+        """校验签名和有效期，失败时抛出 TokenError"""
+
+
+class NativeCodec(TokenCodec):
+    """内置实现：标准库 HMAC + cryptography，密钥和头部均预先准备"""
+
+    def __init__(self, signing: TokenKey, rotated: Dict[str, TokenKey] = None):
+        self.signing = signing
+        self.keys: Dict[Optional[str], TokenKey] = {**(rotated or {}), signing.kid: signing}
+        self._by_header = {key.header: key for key in self.keys.values()}
+
+    def encode(self, claims: dict) -> str:
+        if self.signing.sign is None:
+            raise TokenError("未配置签名私钥，不能签发令牌")
+        payload = _b64encode(json.dumps(_normalize(claims), separators=(",", ":")).encode())
+        signing_input = self.signing.header + b"." + payload
+        return (signing_input + b"." + _b64encode(self.signing.sign(signing_input))).decode()
+
+    def decode(self, token: str) -> dict:
+        try:
+            raw = token.encode("ascii")
+            header, payload, signature = raw.split(b".")
+        except (UnicodeEncodeError, ValueError) as e:
+            raise TokenError("Malformed token") from e
+
+        key = self._by_header.get(header) or self._resolve(header)
+        if not key.verify(raw[:len(header) + len(payload) + 1], _b64decode(signature)):
+            raise TokenError("Signature verification failed")
+
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError as e:
+            raise TokenError("Invalid payload") from e
+        if not isinstance(claims, dict):
+            raise TokenError("Invalid payload")
+        _validate(claims)
+        return claims
+
+    def _resolve(self, segment: bytes) -> TokenKey:
+        """头部不是预先编码的形式时，解析头部按 kid 查找密钥"""
+        try:
+            header = json.loads(_b64decode(segment))
+        except ValueError as e:
+            raise TokenError("Invalid header") from e
+        if not isinstance(header, dict):
+            raise TokenError("Invalid header")
+        kid, alg = header.get("kid"), header.get("alg")
+        if not isinstance(kid, (str, type(None))) or not isinstance(alg, str):
+            raise TokenError("Invalid header")
+        key = self.keys.get(kid) if kid else self.signing
+        # 只接受密钥自身的算法，防止算法混淆
+        if key is None or alg != key.alg:
+            raise TokenError("Unknown key or algorithm")
+        return key
+
+
+class JoseCodec(TokenCodec):
+    """python-jose 实现，保留作为对照和兼容选项（不支持 EdDSA）"""
+
+    def __init__(self, alg: str, signing_key: Optional[str], verify_keys: Dict[Optional[str], str], kid: Optional[str]):
+        from jose import JWTError, jwt
+
+        self._jwt, self._error = jwt, JWTError
+        self.alg = alg
+        self.signing_key = signing_key
+        self.verify_keys = verify_keys
+        self.kid = kid or None
+
+    def encode(self, claims: dict) -> str:
+        if self.signing_key is None:
+            raise TokenError("未配置签名私钥，不能签发令牌")
+        headers = {"kid": self.kid} if self.kid else None
+        return self._jwt.encode(claims, self.signing_key, algorithm=self.alg, headers=headers)
+
+    def decode(self, token: str) -> dict:
+        try:
+            kid = self._jwt.get_unverified_header(token).get("kid")
+            if not isinstance(kid, (str, type(None))):
+                raise TokenError("Invalid header")
+            key = self.verify_keys.get(kid) if kid else self.verify_keys.get(self.kid)
+            if key is None:
+                raise TokenError("Unknown key")
+            return self._jwt.decode(token, key, algorithms=[self.alg])
+        except self._error as e:
+            raise TokenError(str(e)) from e
+
+
+def _normalize(claims: dict) -> dict:
+    for name in _TIME_CLAIMS:
+        value = claims.get(name)
+        if isinstance(value, datetime):
+            claims = {**claims, name: calendar.timegm(value.utctimetuple())}
+    return claims
+
+
+def _validate(claims: dict):
+    now = int(time.time())
+    exp = claims.get("exp")
+    if exp is not None:
+        if isinstance(exp, bool) or not isinstance(exp, (int, float)):
+            raise TokenError("Invalid exp claim")
+        if exp < now:
+            raise TokenError("Signature has expired")
+    nbf = claims.get("nbf")
+    if nbf is not None:
+        if isinstance(nbf, bool) or not isinstance(nbf, (int, float)):
+            raise TokenError("Invalid nbf claim")
+        if nbf > now:
+            raise TokenError("The token is not yet valid")
+
+
+def _read(path: str) -> Optional[bytes]:
+    if not path:
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@lru_cache()
+def get_token_codec() -> TokenCodec:
+    """按配置创建进程内唯一的编解码器"""
+    alg = settings.ALGORITHM
+    kid = settings.JWT_KEY_ID or None
+    rotated = settings.jwt_rotated_keys
+
+    if alg not in HMAC_ALGORITHMS and alg not in ASYMMETRIC_ALGORITHMS:
+        raise ValueError(f"不支持的 JWT 算法: {alg}")
+
+    if settings.JWT_BACKEND == "jose":
+        if alg in HMAC_ALGORITHMS:
+            signing_key = settings.SECRET_KEY
+            verify_keys = {kid: settings.SECRET_KEY, **rotated}
+        elif alg == "ES256":
+            private_pem, public_pem = _read(settings.JWT_PRIVATE_KEY_FILE), _read(settings.JWT_PUBLIC_KEY_FILE)
+            signing_key = private_pem.decode() if private_pem else None
+            current = public_pem or private_pem
+            if current is None:
+                raise ValueError("ES256 需要配置私钥或公钥")
+            verify_keys = {kid: current.decode(), **{k: _read(path).decode() for k, path in rotated.items()}}
+        else:
+            raise ValueError("python-jose 不支持 EdDSA，请使用 JWT_BACKEND=native")
+        return JoseCodec(alg, signing_key, verify_keys, kid)
+
+    if settings.JWT_BACKEND != "native":
+        raise ValueError(f"未知的 JWT_BACKEND: {settings.JWT_BACKEND}")
+
+    if alg in HMAC_ALGORITHMS:
+        signing = hmac_key(alg, settings.SECRET_KEY, kid)
+        old = {k: hmac_key(alg, secret, k) for k, secret in rotated.items()}
+    else:
+        signing = asymmetric_key(alg, _read(settings.JWT_PRIVATE_KEY_FILE), _read(settings.JWT_PUBLIC_KEY_FILE), kid)
+        old = {k: asymmetric_key(alg, None, _read(path), k) for k, path in rotated.items()}
+    return NativeCodec(signing, old)
+
+
+def generate_key_pair(alg: str):
+    """生成 (私钥 PEM, 公钥 PEM)"""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+    if alg == "EdDSA":
+        private = ed25519.Ed25519PrivateKey.generate()
+    elif alg == "ES256":
+        private = ec.generate_private_key(ec.SECP256R1())
+    else:
+        raise ValueError(f"只能为 {' / '.join(ASYMMETRIC_ALGORITHMS)} 生成密钥对")
+    private_pem = private.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    public_pem = private.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    return private_pem, public_pem
+
+
+if __name__ == "__main__":
+    # python -m shared.utils.tokens EdDSA keys/jwt
+    import os
+    import sys
+
+    algorithm = sys.argv[1] if len(sys.argv) > 1 else "EdDSA"
+    prefix = sys.argv[2] if len(sys.argv) > 2 else "jwt"
+    private_pem, public_pem = generate_key_pair(algorithm)
+    # 私钥只允许属主读写
+    with open(os.open(f"{prefix}-private.pem", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+        f.write(private_pem)
+    with open(f"{prefix}-public.pem", "wb") as f:
+        f.write(public_pem)
+    print(f"✓ 已生成 {algorithm} 密钥对: {prefix}-private.pem / {prefix}-public.pem")
@@ -4,21 +4,21 @@
 """
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-import httpx
-import asyncio
 from typing import Optional
+import sys
+import os
 
-# 创建 FastAPI 应用
-app = FastAPI(
-    title="Demo Plugin Service",
-    description="演示插件服务 - 展示热插拔机制",
-    version="1.0.0",
-)
+# 本地运行时从仓库的 backend 目录加载插件 SDK（容器中挂载到 /app/shared）
+backend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "backend")
+if os.path.isdir(backend_dir):
+    sys.path.insert(0, backend_dir)
+
+from shared.plugin_sdk import PluginClient
 
 
 # ==================== 服务注册相关 ====================
 
-REGISTRY_URL = "http://localhost:8001"
+REGISTRY_URL = os.getenv("REGISTRY_URL", "http://localhost:8001")
 SERVICE_CONFIG = {
     "name": "demo-service",
     "display_name": "演示服务",
@@ -57,60 +57,16 @@ SERVICE_CONFIG = {
 }
 
 
-async def register_service():
-    """向注册中心注册服务"""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{REGISTRY_URL}/api/registry/register",
-                json=SERVICE_CONFIG,
-            )
-            if response.status_code in [200, 201]:
-                print(f"✓ 服务注册成功: {SERVICE_CONFIG['name']}")
-                return response.json()
-            else:
-                print(f"✗ 服务注册失败: {response.status_code} - {response.text}")
-        except Exception as e:
-            print(f"✗ 连接注册中心失败: {e}")
-
-
-async def send_heartbeat():
-    """定期发送心跳"""
-    while True:
-        await asyncio.sleep(30)  # 每30秒发送一次心跳
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{REGISTRY_URL}/api/registry/heartbeat",
-                    json={
-                        "service_id": SERVICE_CONFIG["name"],
-                        "status": "healthy",
-                    },
-                )
-                if response.status_code == 200:
-                    print("♥ 心跳发送成功")
-            except Exception as e:
-                print(f"✗ 心跳发送失败: {e}")
-
-
-@app.on_event("startup")
-async def startup_event():
-    """启动时注册服务并开始心跳"""
-    await register_service()
-    asyncio.create_task(send_heartbeat())
-
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """关闭时注销服务"""
-    async with httpx.AsyncClient() as client:
-        try:
-            await client.post(
-                f"{REGISTRY_URL}/api/registry/deregister/{SERVICE_CONFIG['name']}"
-            )
-            print("✓ 服务注销成功")
-        except Exception as e:
-            print(f"✗ 服务注销失败: {e}")
+# 注册、心跳（带抖动和退避）、重新注册与注销由插件 SDK 负责
+plugin = PluginClient(REGISTRY_URL, SERVICE_CONFIG)
+
+# 创建 FastAPI 应用
+app = FastAPI(
+    title="Demo Plugin Service",
+    description="演示插件服务 - 展示热插拔机制",
+    version="1.0.0",
+    lifespan=plugin.lifespan,
+)
 
 
 # ==================== 业务逻辑 ====================
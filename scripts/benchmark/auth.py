@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+认证热路径微基准：签发 / 解码 JWT、校验密码，以及完整的 get_current_user 依赖解析
+
+    python scripts/benchmark/auth.py
+    python scripts/benchmark/auth.py --save auth-baseline.json
+    python scripts/benchmark/auth.py --baseline auth-baseline.json --threshold 0.15
+
+每项基准多轮运行取每次调用耗时的中位数，另用 tracemalloc 统计每次调用的峰值内存分配；
+指定 --baseline 时任一项耗时或内存超过基线的 (1 + threshold) 倍即以非零状态退出，可用于 CI
+基线与机器相关，应在同一台机器上先于改动生成
+"""
+import argparse
+import asyncio
+import atexit
+import gc
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "backend")
+
+# 使用临时 SQLite 数据库，需在导入 shared 之前设置
+_workdir = tempfile.mkdtemp(prefix="saas-auth-bench-")
+atexit.register(shutil.rmtree, _workdir, ignore_errors=True)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'bench.db')}"
+os.environ.setdefault("TRACING_ENABLED", "false")
+sys.path.insert(0, BACKEND_DIR)
+
+from fastapi import Depends, FastAPI  # noqa: E402
+from fastapi.security import HTTPAuthorizationCredentials  # noqa: E402
+
+from shared.database import Base, SessionLocal, engine  # noqa: E402
+from shared.dependencies import get_current_user  # noqa: E402
+from shared.models import User  # noqa: E402
+from shared.utils.auth import (  # noqa: E402
+    create_access_token,
+    decode_token,
+    get_password_hash,
+    load_auth_backends,
+    verify_password,
+)
+
+PASSWORD = "bench-password"
+
+
+class Fixture:
+    """基准共用的数据：一个用户、它的令牌和一个只依赖 get_current_user 的应用"""
+
+    def __init__(self):
+        load_auth_backends()
+        Base.metadata.create_all(bind=engine)
+        with SessionLocal() as db:
+            user = User(username="bench", email="bench@example.com", hashed_password=get_password_hash(PASSWORD))
+            db.add(user)
+            db.commit()
+            self.user_id = user.id
+            self.hashed_password = user.hashed_password
+        self.claims = {"sub": self.user_id, "username": "bench", "role": "user"}
+        self.token = create_access_token(self.claims)
+        self.credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=self.token)
+
+        app = FastAPI()
+
+        @app.get("/me")
+        async def me(user: User = Depends(get_current_user)):
+            return None
+
+        self.app = app
+        self.scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/me",
+            "raw_path": b"/me",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"authorization", f"Bearer {self.token}".encode())],
+            "client": ("127.0.0.1", 50000),
+            "server": ("127.0.0.1", 8000),
+        }
+
+
+def build_benchmarks(fixture: Fixture) -> Dict[str, dict]:
+    """基准名 -> {fn, 是否异步, 每轮调用次数}"""
+
+    def create():
+        create_access_token(fixture.claims)
+
+    def decode():
+        decode_token(fixture.token)
+
+    def verify():
+        verify_password(PASSWORD, fixture.hashed_password)
+
+    async def direct():
+        # 只计函数本身：解码令牌 + 查询用户
+        with SessionLocal() as db:
+            await get_current_user(fixture.credentials, db)
+
+    async def resolve():
+        # 经 FastAPI 路由和依赖注入（HTTPBearer、get_db、get_current_user）完整处理一次请求
+        status = None
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        await fixture.app(dict(fixture.scope), receive, send)
+        if status != 200:
+            raise RuntimeError(f"get_current_user 解析失败: {status}")
+
+    return {
+        "create_access_token": {"fn": create, "is_async": False, "number": 2000},
+        "decode_token": {"fn": decode, "is_async": False, "number": 2000},
+        "verify_password": {"fn": verify, "is_async": False, "number": 5},
+        "get_current_user": {"fn": direct, "is_async": True, "number": 500},
+        "get_current_user_resolved": {"fn": resolve, "is_async": True, "number": 500},
+    }
+
+
+def _batch(fn: Callable, is_async: bool, number: int, loop) -> float:
+    """调用 number 次，返回总耗时"""
+    if is_async:
+        async def run():
+            started = time.perf_counter()
+            for _ in range(number):
+                await fn()
+            return time.perf_counter() - started
+
+        return loop.run_until_complete(run())
+
+    started = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return time.perf_counter() - started
+
+
+def _peak_allocation(fn: Callable, is_async: bool, number: int, loop) -> int:
+    """每次调用期间新分配内存峰值的中位数（字节）"""
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(number):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            if is_async:
+                loop.run_until_complete(fn())
+            else:
+                fn()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - baseline)
+    finally:
+        tracemalloc.stop()
+    return int(statistics.median(peaks))
+
+
+def run(names, repeat: int, scale: float) -> Dict[str, dict]:
+    fixture = Fixture()
+    benchmarks = build_benchmarks(fixture)
+    loop = asyncio.new_event_loop()
+    results = {}
+    try:
+        for name in names:
+            spec = benchmarks[name]
+            fn, is_async = spec["fn"], spec["is_async"]
+            number = max(1, int(spec["number"] * scale))
+
+            _batch(fn, is_async, max(1, number // 10), loop)  # 预热
+            gc.collect()
+            per_call = [_batch(fn, is_async, number, loop) / number for _ in range(repeat)]
+            results[name] = {
+                "median_us": round(statistics.median(per_call) * 1e6, 3),
+                "min_us": round(min(per_call) * 1e6, 3),
+                "peak_alloc_bytes": _peak_allocation(fn, is_async, min(number, 100), loop),
+                "calls": number * repeat,
+            }
+            result = results[name]
+            print(
+                f"  {name:<28} {result['median_us']:>12.1f} µs/次 (最快 {result['min_us']:.1f})"
+                f"  峰值分配 {result['peak_alloc_bytes']:>8} B"
+            )
+    finally:
+        loop.close()
+    return results
+
+
+def check(results: Dict[str, dict], baseline_path: str, threshold: float, memory_threshold: float) -> bool:
+    """与基线比较，任一项超出阈值返回 False"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+
+    passed = True
+    print(f"\n与基线 {baseline_path} 比较（耗时阈值 +{threshold:.0%}，内存阈值 +{memory_threshold:.0%}）:")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"  {name:<28} 基线中没有该项，跳过")
+            continue
+        time_ratio = result["median_us"] / before["median_us"]
+        memory_ratio = result["peak_alloc_bytes"] / max(before["peak_alloc_bytes"], 1)
+        failures = []
+        if time_ratio > 1 + threshold:
+            failures.append("耗时")
+        if memory_ratio > 1 + memory_threshold:
+            failures.append("内存")
+        mark = "✗ " + "、".join(failures) + "退化" if failures else "✓"
+        print(f"  {name:<28} 耗时 {time_ratio - 1:+7.1%}  内存 {memory_ratio - 1:+7.1%}  {mark}")
+        passed = passed and not failures
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="认证热路径微基准")
+    parser.add_argument("--only", help="只运行指定基准（逗号分隔）")
+    parser.add_argument("--repeat", type=int, default=5, help="每项基准的轮数")
+    parser.add_argument("--scale", type=float, default=1.0, help="每轮调用次数的倍率")
+    parser.add_argument("--save", help="将结果保存为基线文件")
+    parser.add_argument("--baseline", help="与基线比较，超出阈值时以状态 1 退出")
+    parser.add_argument("--threshold", type=float, default=0.2, help="允许的耗时增长比例")
+    parser.add_argument("--memory-threshold", type=float, default=0.2, help="允许的峰值分配增长比例")
+    args = parser.parse_args()
+
+    names = ["create_access_token", "decode_token", "verify_password", "get_current_user", "get_current_user_resolved"]
+    if args.only:
+        selected = [n.strip() for n in args.only.split(",") if n.strip()]
+        unknown = [n for n in selected if n not in names]
+        if unknown:
+            raise SystemExit(f"未知基准: {', '.join(unknown)}（可选: {', '.join(names)}）")
+        names = selected
+
+    print("认证热路径微基准:")
+    results = run(names, args.repeat, args.scale)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+        print(f"\n结果已写入 {args.save}")
+
+    if args.baseline and not check(results, args.baseline, args.threshold, args.memory_threshold):
+        print("\n✗ 认证热路径性能退化")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+压测用的假上游服务
+任意路径都返回同样大小的 JSON，固定延迟和错误率可配置；直接实现 ASGI，避免自身成为瓶颈
+
+    python scripts/benchmark/fake_upstream.py --port 9100 --latency-ms 5 --payload-bytes 1024 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+
+
+def create_app(latency_ms: float = 0.0, payload_bytes: int = 256, error_rate: float = 0.0):
+    """创建假上游 ASGI 应用"""
+    body = json.dumps({"data": "x" * max(payload_bytes - 12, 0)}).encode()
+    error_body = b'{"detail":"injected error"}'
+    latency = latency_ms / 1000
+
+    def headers(content: bytes):
+        return [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(content)).encode()),
+        ]
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+
+        # 读完请求体，模拟真实服务的接收开销
+        more_body = True
+        while more_body:
+            message = await receive()
+            more_body = message.get("more_body", False)
+
+        if latency:
+            await asyncio.sleep(latency)
+
+        if error_rate and random.random() < error_rate:
+            await send({"type": "http.response.start", "status": 500, "headers": headers(error_body)})
+            await send({"type": "http.response.body", "body": error_body})
+            return
+
+        await send({"type": "http.response.start", "status": 200, "headers": headers(body)})
+        await send({"type": "http.response.body", "body": body})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="压测用的假上游服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="每个请求的固定延迟")
+    parser.add_argument("--payload-bytes", type=int, default=256, help="响应体大小")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run(
+        create_app(args.latency_ms, args.payload_bytes, args.error_rate),
+        host=args.host,
+        port=args.port,
+        lifespan="off",
+        access_log=False,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+开环（open-loop）负载生成器
+按固定到达速率发出请求，不等待前一个请求完成；延迟从计划发送时间开始计算，
+服务端变慢时排队时间也计入延迟，避免闭环压测的协调遗漏（coordinated omission）
+"""
+import asyncio
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+# 请求描述：(方法, URL, 请求头, 请求体)
+RequestSpec = Tuple[str, str, Optional[Dict[str, str]], Optional[bytes]]
+
+
+@dataclass
+class LoadResult:
+    """一次压测的原始结果"""
+
+    rate: float
+    duration: float
+    latencies: List[float] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+    errors: Counter = field(default_factory=Counter)
+    dropped: int = 0
+    # 生成器实际发出请求比计划晚的最大秒数，偏大说明压测端自身已饱和
+    max_dispatch_lag: float = 0.0
+    elapsed: float = 0.0
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def summary(self) -> dict:
+        completed = len(self.latencies)
+        ok = sum(count for code, count in self.statuses.items() if code < 400)
+        return {
+            "target_rps": self.rate,
+            "duration_s": self.duration,
+            "requests": completed + sum(self.errors.values()) + self.dropped,
+            "rps": round(completed / self.elapsed, 1) if self.elapsed else 0.0,
+            "ok_rps": round(ok / self.elapsed, 1) if self.elapsed else 0.0,
+            "latency_ms": {
+                "p50": round(self.percentile(0.50) * 1000, 3),
+                "p99": round(self.percentile(0.99) * 1000, 3),
+                "p999": round(self.percentile(0.999) * 1000, 3),
+                "max": round(max(self.latencies, default=0.0) * 1000, 3),
+                "mean": round(sum(self.latencies) / completed * 1000, 3) if completed else 0.0,
+            },
+            "status_counts": {str(code): count for code, count in sorted(self.statuses.items())},
+            "errors": dict(self.errors),
+            "dropped": self.dropped,
+            "max_dispatch_lag_ms": round(self.max_dispatch_lag * 1000, 3),
+        }
+
+
+async def run_load(
+    next_request: Callable[[int], RequestSpec],
+    rate: float,
+    duration: float,
+    max_in_flight: int = 10000,
+    timeout: float = 30.0,
+    record: bool = True,
+) -> LoadResult:
+    """
+    以 rate 的速率持续 duration 秒发送请求
+    next_request(i) 返回第 i 个请求；在途请求超过 max_in_flight 时丢弃并计数
+    """
+    result = LoadResult(rate=rate, duration=duration)
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    in_flight = 0
+    tasks = set()
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+
+        async def fire(spec: RequestSpec, scheduled: float):
+            nonlocal in_flight
+            method, url, headers, body = spec
+            try:
+                response = await client.request(method, url, headers=headers, content=body)
+                latency = time.perf_counter() - scheduled
+                if record:
+                    result.latencies.append(latency)
+                    result.statuses[response.status_code] += 1
+            except httpx.HTTPError as e:
+                if record:
+                    result.errors[type(e).__name__] += 1
+            finally:
+                in_flight -= 1
+
+        total = int(rate * duration)
+        started = time.perf_counter()
+        for i in range(total):
+            scheduled = started + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                result.max_dispatch_lag = max(result.max_dispatch_lag, -delay)
+
+            if in_flight >= max_in_flight:
+                result.dropped += 1
+                continue
+            in_flight += 1
+            task = asyncio.create_task(fire(next_request(i), scheduled))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        result.elapsed = time.perf_counter() - started
+
+    return result
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+服务启动基准：统计每个服务导入应用的耗时、常驻内存和最慢的依赖包
+
+    python scripts/benchmark/startup.py
+    python scripts/benchmark/startup.py --runs 10 --top 15 --json startup.json
+
+每次在全新的子进程中用 python -X importtime 导入 <service>.main，取多次运行的中位数
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "backend")
+
+SERVICES = ["gateway", "registry", "core"]
+
+# 子进程导入应用后输出峰值常驻内存（Linux 为 KB，macOS 为字节）
+PROBE = """
+import resource, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss //= 1024
+print(elapsed, rss)
+"""
+
+
+def run_once(service: str):
+    """导入一次服务，返回 (导入耗时秒, 峰值内存 KB, 各顶层包的自身导入耗时微秒)"""
+    module = f"{service}.main"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module)],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{result.stderr[-2000:]}")
+
+    packages = defaultdict(int)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # 格式: import time: self [us] | cumulative | imported package
+        self_us, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us)
+
+    elapsed, rss = result.stdout.split()
+    return float(elapsed), int(rss), packages
+
+
+def bench(service: str, runs: int, top: int) -> dict:
+    durations, memories = [], []
+    packages = defaultdict(list)
+    for _ in range(runs):
+        elapsed, rss, pkgs = run_once(service)
+        durations.append(elapsed)
+        memories.append(rss)
+        for name, us in pkgs.items():
+            packages[name].append(us)
+
+    slowest = sorted(
+        ((name, statistics.median(values) / 1000) for name, values in packages.items()),
+        key=lambda item: item[1],
+        reverse=True,
+    )[:top]
+    return {
+        "service": service,
+        "import_ms": round(statistics.median(durations) * 1000, 1),
+        "max_rss_mb": round(statistics.median(memories) / 1024, 1),
+        "slowest_packages_ms": {name: round(ms, 1) for name, ms in slowest},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="服务启动（导入）基准")
+    parser.add_argument("services", nargs="*", default=SERVICES)
+    parser.add_argument("--runs", type=int, default=5, help="每个服务运行次数，取中位数")
+    parser.add_argument("--top", type=int, default=10, help="列出自身导入最慢的包数量")
+    parser.add_argument("--json", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    results = []
+    for service in args.services:
+        result = bench(service, args.runs, args.top)
+        results.append(result)
+        print(f"{service}: 导入 {result['import_ms']} ms, 峰值内存 {result['max_rss_mb']} MB")
+        for name, ms in result["slowest_packages_ms"].items():
+            print(f"    {name:<24} {ms:>8.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
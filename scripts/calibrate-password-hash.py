@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+按目标登录延迟校准密码哈希参数，在部署的目标机器上运行，输出可直接写入 .env 的配置
+
+    python scripts/calibrate-password-hash.py --target-ms 250
+    python scripts/calibrate-password-hash.py --scheme argon2 --target-ms 250 --memory-mib 64
+
+bcrypt 选择耗时不超过目标的最大 rounds；argon2id 在给定内存下选择耗时不超过目标的最大 time_cost，
+内存过大以致 time_cost=1 也超过目标时减半内存
+"""
+import argparse
+import importlib.util
+import statistics
+import time
+
+PASSWORD = "calibration-password"
+
+
+def measure(handler, samples: int) -> float:
+    """多次哈希取中位数（秒）"""
+    handler.hash(PASSWORD)  # 预热
+    durations = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        handler.hash(PASSWORD)
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations)
+
+
+def calibrate_bcrypt(target: float, samples: int) -> dict:
+    from passlib.hash import bcrypt
+
+    chosen, chosen_duration = 4, None
+    for rounds in range(4, 20):
+        duration = measure(bcrypt.using(rounds=rounds), samples)
+        print(f"  bcrypt rounds={rounds:<2} {duration * 1000:8.1f} ms")
+        if duration > target:
+            break
+        chosen, chosen_duration = rounds, duration
+    return {"settings": {"PASSWORD_HASH_SCHEME": "bcrypt", "BCRYPT_ROUNDS": chosen}, "duration": chosen_duration}
+
+
+def calibrate_argon2(target: float, samples: int, memory_mib: int, parallelism: int) -> dict:
+    from passlib.hash import argon2
+
+    memory = memory_mib * 1024
+    while memory >= 8 * 1024:
+        chosen, chosen_duration = None, None
+        for time_cost in range(1, 20):
+            handler = argon2.using(type="ID", rounds=time_cost, memory_cost=memory, parallelism=parallelism)
+            duration = measure(handler, samples)
+            print(f"  argon2id m={memory // 1024:>4} MiB t={time_cost:<2} {duration * 1000:8.1f} ms")
+            if duration > target:
+                break
+            chosen, chosen_duration = time_cost, duration
+        if chosen is not None:
+            return {
+                "settings": {
+                    "PASSWORD_HASH_SCHEME": "argon2",
+                    "ARGON2_TIME_COST": chosen,
+                    "ARGON2_MEMORY_COST": memory,
+                    "ARGON2_PARALLELISM": parallelism,
+                },
+                "duration": chosen_duration,
+            }
+        memory //= 2
+    raise SystemExit("✗ 即使 8 MiB、time_cost=1 也超过目标延迟，请提高 --target-ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按目标延迟校准密码哈希参数")
+    parser.add_argument("--scheme", choices=["bcrypt", "argon2"], default="bcrypt")
+    parser.add_argument("--target-ms", type=float, default=250, help="单次哈希的目标耗时上限")
+    parser.add_argument("--samples", type=int, default=5, help="每组参数的测量次数")
+    parser.add_argument("--memory-mib", type=int, default=64, help="argon2 初始内存（MiB）")
+    parser.add_argument("--parallelism", type=int, default=1, help="argon2 并行度")
+    args = parser.parse_args()
+
+    target = args.target_ms / 1000
+    print(f"校准 {args.scheme}，目标 ≤ {args.target_ms:.0f} ms:")
+    if args.scheme == "bcrypt":
+        result = calibrate_bcrypt(target, args.samples)
+    else:
+        if importlib.util.find_spec("argon2") is None:
+            raise SystemExit("✗ argon2 需要安装 argon2-cffi: pip install argon2-cffi")
+        result = calibrate_argon2(target, args.samples, args.memory_mib, args.parallelism)
+
+    duration = result["duration"]
+    print("\n建议配置:")
+    for key, value in result["settings"].items():
+        print(f"{key}={value}")
+    if duration:
+        print(f"\n单次哈希约 {duration * 1000:.0f} ms，每个核每秒约 {1 / duration:.1f} 次登录；")
+        print("登录 CPU 上限约为 worker 数 × PASSWORD_HASH_CONCURRENCY 个核")
+
+
+if __name__ == "__main__":
+    main()
@@ -53,6 +53,11 @@ fi
 # 创建日志目录
 mkdir -p logs
 
+# 执行数据库迁移（服务启动时只校验结构版本，不再建表）
+echo ""
+echo "执行数据库迁移..."
+(cd backend && python -m shared.migrate)
+
 # 启动服务
 echo ""
 echo "======================================"
@@ -63,7 +68,7 @@ echo ""
 # 启动服务注册中心
 echo "启动服务注册中心 (端口 8001)..."
 cd backend/registry
-python main.py > ../../logs/registry.log 2>&1 &
+python run.py --reload > ../../logs/registry.log 2>&1 &
 REGISTRY_PID=$!
 echo "  PID: $REGISTRY_PID"
 cd ../..
@@ -73,7 +78,7 @@ sleep 2
 # 启动 API 网关
 echo "启动 API 网关 (端口 8000)..."
 cd backend/gateway
-python main.py > ../../logs/gateway.log 2>&1 &
+python run.py --reload > ../../logs/gateway.log 2>&1 &
 GATEWAY_PID=$!
 echo "  PID: $GATEWAY_PID"
 cd ../..
@@ -83,7 +88,7 @@ sleep 2
 # 启动核心服务
 echo "启动核心服务 (端口 8002)..."
 cd backend/core
-python main.py > ../../logs/core.log 2>&1 &
+python run.py --reload > ../../logs/core.log 2>&1 &
 CORE_PID=$!
 echo "  PID: $CORE_PID"
 cd ../..
@@ -84,6 +84,40 @@ def test_fastapi_apps():
     return True
 
 
+def test_malformed_tokens():
+    """测试格式错误的令牌被拒绝而不是抛出异常"""
+    print("\n测试格式错误的令牌...")
+
+    import base64
+    import json
+
+    from shared.utils.auth import create_access_token, decode_token
+
+    def segment(value):
+        return base64.urlsafe_b64encode(json.dumps(value).encode()).rstrip(b"=").decode()
+
+    _, payload, signature = create_access_token({"sub": "test"}).split(".")
+    headers = [
+        {"alg": "HS256", "kid": [1]},
+        {"alg": "HS256", "kid": {"a": 1}},
+        {"alg": ["HS256"]},
+        {"kid": None},
+        [],
+    ]
+    tokens = [f"{segment(h)}.{payload}.{signature}" for h in headers] + ["a.b", "é.b.c", "!.!.!"]
+    for token in tokens:
+        try:
+            result = decode_token(token)
+        except Exception as e:
+            print(f"✗ 解码 {token[:40]} 时抛出异常: {e!r}")
+            return False
+        if result is not None:
+            print(f"✗ 格式错误的令牌未被拒绝: {token[:40]}")
+            return False
+    print("✓ 格式错误的令牌均被拒绝")
+    return True
+
+
 if __name__ == "__main__":
     print("=" * 50)
     print("SAAS 平台基础测试")
@@ -98,6 +132,9 @@ if __name__ == "__main__":
     if not test_fastapi_apps():
         success = False
 
+    if not test_malformed_tokens():
+        success = False
+
     print()
     print("=" * 50)
     if success: